@@ -0,0 +1,204 @@
+"""
+ماژول فایل‌های استاتیک و کش صفحات (Static Assets & Page Cache)
+----------------------------------------------------------------
+وظایف:
+1. پیش‌پردازش فایل‌های پوشه static در زمان راه‌اندازی: محاسبه هش محتوا،
+   ساخت نام‌های نسخه‌دار (مثلاً styles.3f2a9c1d.css) و نسخه‌های فشرده gzip/brotli.
+2. سرو کردن فایل‌ها با هدرهای ETag و Cache-Control و پاسخ 304 (Not Modified).
+3. نگهداری خروجی رندر شده قالب‌های Jinja2 در حافظه (خروجی این صفحات به درخواست وابسته نیست).
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+from jinja2 import Environment
+
+# کتابخانه brotli اختیاری است؛ در صورت نبود آن فقط نسخه gzip ساخته می‌شود.
+try:
+    import brotli
+except ImportError:  # pragma: no cover - بستگی به محیط نصب دارد
+    brotli = None
+
+# فایل‌های نسخه‌دار هرگز تغییر نمی‌کنند، پس می‌توان آن‌ها را یک سال کش کرد.
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# نام‌های اصلی (بدون هش) باید هر بار با ETag اعتبارسنجی شوند.
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# فایل‌های کوچک‌تر از این اندازه ارزش فشرده‌سازی ندارند.
+MIN_COMPRESS_SIZE = 512
+HASH_LENGTH = 8
+
+
+@dataclass
+class Asset:
+    """یک فایل پیش‌پردازش شده به همراه نسخه‌های فشرده و متادیتای کش."""
+    body: bytes
+    media_type: str
+    etag: str
+    variants: Dict[str, bytes] = field(default_factory=dict)  # encoding -> bytes
+
+
+def build_asset(body: bytes, media_type: str) -> Asset:
+    """
+    ساخت آبجکت Asset از محتوای خام.
+    نسخه فشرده فقط زمانی نگه داشته می‌شود که واقعاً از نسخه اصلی کوچک‌تر باشد.
+    """
+    digest = hashlib.sha256(body).hexdigest()
+    asset = Asset(body=body, media_type=media_type, etag=f'"{digest[:16]}"')
+
+    if len(body) >= MIN_COMPRESS_SIZE:
+        gz = gzip.compress(body, compresslevel=9, mtime=0)
+        if len(gz) < len(body):
+            asset.variants["gzip"] = gz
+        if brotli is not None:
+            br = brotli.compress(body, quality=11)
+            if len(br) < len(body):
+                asset.variants["br"] = br
+    return asset
+
+
+def choose_encoding(asset: Asset, accept_encoding: str) -> Optional[str]:
+    """انتخاب بهترین نسخه فشرده بر اساس هدر Accept-Encoding (اولویت با brotli)."""
+    accepted = set()
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0"):
+            continue
+        accepted.add(token.strip().lower())
+
+    for encoding in ("br", "gzip"):
+        if encoding in asset.variants and (encoding in accepted or "*" in accepted):
+            return encoding
+    return None
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """بررسی هدر If-None-Match برای پاسخ 304."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # ETagهای ضعیف (W/) هم برای GET قابل قبول هستند.
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag in candidates
+
+
+def asset_response(request: Request, asset: Asset, cache_control: str) -> Response:
+    """ساخت پاسخ HTTP برای یک Asset (شامل 304، انتخاب encoding و هدرهای کش)."""
+    headers = {
+        "ETag": asset.etag,
+        "Cache-Control": cache_control,
+        "Vary": "Accept-Encoding",
+    }
+    if etag_matches(request, asset.etag):
+        return Response(status_code=304, headers=headers)
+
+    encoding = choose_encoding(asset, request.headers.get("accept-encoding", ""))
+    if encoding:
+        headers["Content-Encoding"] = encoding
+        body = asset.variants[encoding]
+    else:
+        body = asset.body
+
+    if request.method == "HEAD":
+        headers["Content-Length"] = str(len(body))
+        return Response(status_code=200, headers=headers, media_type=asset.media_type)
+    return Response(content=body, headers=headers, media_type=asset.media_type)
+
+
+class StaticAssetStore:
+    """
+    مخزن فایل‌های استاتیک (Static Asset Store).
+    تمام فایل‌ها یک بار در زمان راه‌اندازی خوانده و فشرده می‌شوند؛
+    پس از آن هیچ عملیات دیسک یا فشرده‌سازی در مسیر درخواست انجام نمی‌شود.
+    """
+
+    def __init__(self, directory: str, url_prefix: str = "/static"):
+        self.directory = directory
+        self.url_prefix = url_prefix.rstrip("/")
+        self._assets: Dict[str, Asset] = {}       # نام اصلی -> Asset
+        self._hashed: Dict[str, str] = {}         # نام نسخه‌دار -> نام اصلی
+        self._public: Dict[str, str] = {}         # نام اصلی -> نام نسخه‌دار
+        self.reload()
+
+    @staticmethod
+    def hashed_name(name: str, etag: str) -> str:
+        """درج هش محتوا در نام فایل: styles.css -> styles.<hash>.css"""
+        stem, ext = os.path.splitext(name)
+        digest = etag.strip('"')[:HASH_LENGTH]
+        return f"{stem}.{digest}{ext}"
+
+    def reload(self) -> None:
+        """خواندن مجدد تمام فایل‌های پوشه static (در حالت عادی فقط یکبار صدا زده می‌شود)."""
+        assets, hashed, public = {}, {}, {}
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                full_path = os.path.join(root, filename)
+                name = os.path.relpath(full_path, self.directory).replace(os.sep, "/")
+                with open(full_path, "rb") as f:
+                    body = f.read()
+                media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+                if media_type.startswith("text/") or media_type in ("application/javascript", "text/javascript"):
+                    media_type += "; charset=utf-8"
+                asset = build_asset(body, media_type)
+                versioned = self.hashed_name(name, asset.etag)
+                assets[name] = asset
+                hashed[versioned] = name
+                public[name] = versioned
+        self._assets, self._hashed, self._public = assets, hashed, public
+
+    def url_for(self, name: str) -> str:
+        """آدرس نسخه‌دار یک فایل برای استفاده در قالب‌ها (در صورت نبود فایل، آدرس ساده)."""
+        return f"{self.url_prefix}/{self._public.get(name, name)}"
+
+    def lookup(self, path: str):
+        """
+        پیدا کردن Asset بر اساس مسیر درخواست.
+        خروجی: (asset, immutable) یا (None, False) اگر فایل وجود نداشته باشد.
+        """
+        if path in self._hashed:
+            return self._assets[self._hashed[path]], True
+        if path in self._assets:
+            return self._assets[path], False
+        return None, False
+
+    def response(self, request: Request, path: str) -> Optional[Response]:
+        """پاسخ آماده برای مسیر درخواستی یا None (برای 404)."""
+        asset, immutable = self.lookup(path)
+        if asset is None:
+            return None
+        cache_control = IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL
+        return asset_response(request, asset, cache_control)
+
+
+class PageCache:
+    """
+    کش خروجی قالب‌ها (Rendered Template Cache).
+    صفحات ورود و داشبورد به درخواست وابسته نیستند (داده‌ها با AJAX دریافت می‌شوند)،
+    پس هر قالب فقط یک بار رندر و فشرده می‌شود.
+    """
+
+    def __init__(self, env: Environment):
+        self.env = env
+        self._pages: Dict[str, Asset] = {}
+
+    def get(self, template_name: str) -> Asset:
+        page = self._pages.get(template_name)
+        if page is None:
+            html = self.env.get_template(template_name).render()
+            page = build_asset(html.encode("utf-8"), "text/html; charset=utf-8")
+            self._pages[template_name] = page
+        return page
+
+    def clear(self) -> None:
+        self._pages.clear()
+
+    def response(self, request: Request, template_name: str) -> Response:
+        return asset_response(request, self.get(template_name), REVALIDATE_CACHE_CONTROL)
@@ -1,24 +1,122 @@
 """
 ماژول پیکربندی دیتابیس (Database Configuration)
 ---------------------------------------------
-وظیفه: برقراری اتصال به دیتابیس SQLite و مدیریت نشست‌ها (Sessions).
+وظیفه: برقراری اتصال به دیتابیس و مدیریت نشست‌ها (Sessions).
+
+آدرس دیتابیس از متغیر محیطی DATABASE_URL خوانده می‌شود (پیش‌فرض: فایل SQLite محلی).
+تنظیمات موتور بر اساس نوع دیتابیس (Dialect) به صورت خودکار انتخاب می‌شوند:
+- SQLite: حالت WAL (خواندن همزمان با نوشتن) و انتظار به جای خطای قفل (busy_timeout).
+- PostgreSQL: Connection Pool با اندازه قابل تنظیم و بررسی سلامت اتصال‌ها (pool_pre_ping).
+  برای PostgreSQL نصب درایور (مثلاً psycopg2-binary) لازم است.
 """
 
-from sqlalchemy import create_engine
+import os
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 
 # مسیر فایل دیتابیس (Connection String)
-# فایل gpu_service.db در پوشه اصلی پروژه ساخته خواهد شد.
-SQLALCHEMY_DATABASE_URL = "sqlite:///./gpu_service.db"
+# در حالت پیش‌فرض فایل gpu_service.db در پوشه اصلی پروژه ساخته خواهد شد.
+SQLALCHEMY_DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./gpu_service.db")
+
+# تنظیمات Pool برای دیتابیس‌های سرور-محور (PostgreSQL)
+POOL_SIZE = int(os.environ.get("GPU_DB_POOL_SIZE", 10))
+MAX_OVERFLOW = int(os.environ.get("GPU_DB_MAX_OVERFLOW", 20))
+POOL_RECYCLE = int(os.environ.get("GPU_DB_POOL_RECYCLE", 1800))
+# حداکثر زمان انتظار SQLite برای آزاد شدن قفل نوشتن (میلی‌ثانیه)
+SQLITE_BUSY_TIMEOUT_MS = 5000
+
+def _is_sqlite_memory(url) -> bool:
+    return url.database in (None, "", ":memory:")
+
+def make_engine(url: str = SQLALCHEMY_DATABASE_URL) -> Engine:
+    """
+    ساخت موتور دیتابیس (Engine) با تنظیمات مناسب هر Dialect.
+
+    - SQLite: آرگومان check_same_thread=False لازم است چون در FastAPI هر درخواست ممکن است
+      در یک ترد جداگانه اجرا شود. دیتابیس درون‌حافظه‌ای با StaticPool ساخته می‌شود تا
+      تمام نشست‌ها یک اتصال (و در نتیجه یک دیتابیس) مشترک داشته باشند.
+    - PostgreSQL (و سایر دیتابیس‌های سرور-محور): Pool با اندازه ثابت و سرریز محدود.
+    """
+    parsed = make_url(url)
+    if parsed.get_backend_name() != "sqlite":
+        return create_engine(
+            url,
+            pool_size=POOL_SIZE,
+            max_overflow=MAX_OVERFLOW,
+            pool_pre_ping=True,
+            pool_recycle=POOL_RECYCLE,
+        )
+
+    if _is_sqlite_memory(parsed):
+        return create_engine(url, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+
+    sqlite_engine = create_engine(url, connect_args={"check_same_thread": False})
+
+    @event.listens_for(sqlite_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.close()
+
+    return sqlite_engine
+
+def supports_skip_locked(bind) -> bool:
+    """آیا دیتابیس از SELECT ... FOR UPDATE SKIP LOCKED پشتیبانی می‌کند؟ (bind: Engine یا Session)"""
+    if hasattr(bind, "get_bind"):
+        bind = bind.get_bind()
+    return bind.dialect.name == "postgresql"
+
+# ستون‌هایی که پس از نسخه اولیه به جداول اضافه شده‌اند:
+# (جدول، ستون، عبارت SQL مقدار اولیه برای ردیف‌های قدیمی یا None)
+# create_all ستون جدید به جدول موجود اضافه نمی‌کند، پس upgrade_schema آن‌ها را اضافه می‌کند.
+ADDED_COLUMNS = [
+    ("jobs", "attempts", "0"),
+    ("jobs", "progress", "0"),
+    ("jobs", "eta_seconds", None),
+    ("jobs", "content_hash", None),
+    ("jobs", "priority", "0"),
+    ("jobs", "preempt_count", "0"),
+    ("jobs", "consumed_seconds", "0"),
+    ("jobs", "status_changed_at", "created_at"),
+    ("jobs", "request_id", None),
+    ("jobs", "approved_request_id", None),
+    ("jobs", "storage_key", "'job_' || id"),
+]
+
+def upgrade_schema(bind=None) -> list:
+    """
+    مهاجرت سبک و تکرارپذیر (Idempotent) دیتابیس‌های ساخته شده با نسخه‌های قبلی.
+    ستون‌های موجود با Inspector (در SQLite همان PRAGMA table_info) بررسی می‌شوند؛
+    ستون‌های غایب با ALTER TABLE ... ADD COLUMN اضافه و برای ردیف‌های قبلی مقداردهی می‌شوند
+    (مثلاً attempts=0، چون attempts + 1 روی NULL همیشه NULL می‌ماند). سپس ایندکس‌های جدید ساخته می‌شوند.
+    باید پس از create_all و ایمپورت models صدا زده شود. خروجی: لیست ستون‌های اضافه شده.
+    """
+    bind = bind or engine
+    added = []
+    inspector = inspect(bind)
+    with bind.begin() as conn:
+        for table_name, column_name, backfill in ADDED_COLUMNS:
+            table = Base.metadata.tables[table_name]
+            existing = {column["name"] for column in inspector.get_columns(table_name)}
+            if column_name in existing:
+                continue
+            column_type = table.c[column_name].type.compile(dialect=bind.dialect)
+            conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}"))
+            if backfill is not None:
+                conn.execute(text(f"UPDATE {table_name} SET {column_name} = {backfill} WHERE {column_name} IS NULL"))
+            added.append(f"{table_name}.{column_name}")
+        for table_name in {table_name for table_name, _, _ in ADDED_COLUMNS}:
+            for index in Base.metadata.tables[table_name].indexes:
+                index.create(bind=conn, checkfirst=True)
+    return added
 
 # 1. ساخت موتور دیتابیس (Engine)
-# آرگومان check_same_thread=False مخصوص SQLite است.
-# چون SQLite به صورت پیش‌فرض اجازه نمی‌دهد یک ترد (Thread) متفاوت به کانکشن دسترسی داشته باشد،
-# اما در FastAPI هر درخواست ممکن است در یک ترد جداگانه اجرا شود.
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+engine = make_engine()
 
 # 2. ساخت کلاس SessionLocal
 # این کلاس کارخانه (Factory) تولید نشست‌های دیتابیس است.
@@ -29,4 +127,4 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 # 3. کلاس پایه مدل‌ها (Base)
 # تمام کلاس‌های موجود در models.py باید از این کلاس ارث‌بری کنند
 # تا SQLAlchemy بتواند آن‌ها را شناسایی و تبدیل به جدول کند.
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
@@ -0,0 +1,213 @@
+"""
+ماژول پیش‌بینی زمان شروع (Queue Wait-Time Estimation)
+-----------------------------------------------------
+یک مدل درون‌حافظه‌ای از صف و تسک‌های در حال اجرا نگه داشته می‌شود:
+- یک بار در شروع از روی تسک‌های فعال ساخته می‌شود (Bootstrap).
+- تغییرات API (ثبت، تایید، حذف) مستقیماً به مدل اعمال می‌شوند.
+- تغییرات Worker (شروع، پایان، Preemption، Reaper) با یک کوئری کوچک روی ستون ایندکس شده
+  status_changed_at (فقط ردیف‌های تغییر کرده از آخرین همگام‌سازی) دریافت می‌شوند.
+  هر نویسنده status_changed_at را با ساعت خودش و قبل از commit تنظیم می‌کند، پس تغییری که زودتر
+  مهر خورده ولی دیرتر commit شده ممکن است زیر بیشترین مقدار دیده شده قرار بگیرد. به همین دلیل
+  هر همگام‌سازی یک پنجره همپوشانی (SYNC_OVERLAP) قبل از آن مقدار را دوباره می‌خواند
+  (apply تکرارپذیر است) و هر FULL_RESYNC_INTERVAL ثانیه کل مجموعه تسک‌های فعال دوباره بارگذاری می‌شود.
+
+پاسخ به یک پرسش ETA هیچ کوئری روی جدول jobs اجرا نمی‌کند؛ برنامه زمانی (Schedule)
+فقط پس از تغییر مدل یا گذشت چند ثانیه دوباره در حافظه محاسبه می‌شود.
+
+فرض‌ها: ظرفیت خوشه GPU_TOTAL_SLOTS اسلات است، مدت هر تسک همان estimated_duration است
+و تسک‌های PENDING به محض ثبت تایید شده فرض می‌شوند (زمان تایید ادمین مدل نمی‌شود).
+"""
+
+import heapq
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+from sqlalchemy.orm import Session
+from . import models
+
+# ظرفیت کل خوشه (مجموع اسلات‌های تمام Workerها)
+TOTAL_SLOTS = int(os.environ.get("GPU_TOTAL_SLOTS", 1))
+# فاصله همگام‌سازی با تغییرات Worker (ثانیه)
+SYNC_INTERVAL = 1.0
+# پنجره بازخوانی قبل از بیشترین status_changed_at دیده شده (حداکثر عمر تراکنش + اختلاف ساعت‌ها)
+SYNC_OVERLAP = timedelta(seconds=30)
+# فاصله بارگذاری کامل تسک‌های فعال (ترمیم هر تغییر از دست رفته، مثلاً حذف در پروسه دیگر)
+FULL_RESYNC_INTERVAL = 300.0
+# حداکثر عمر برنامه زمانی محاسبه شده (ثانیه)؛ چون زمان باقی‌مانده تسک‌های در حال اجرا کم می‌شود.
+SCHEDULE_TTL = 5.0
+
+ACTIVE_STATUSES = models.ACTIVE_STATUSES
+
+@dataclass
+class JobState:
+    """نمای سبک یک تسک فعال در مدل صف."""
+    id: int
+    status: str
+    priority: int
+    estimated_duration: int
+    consumed_seconds: int
+    started_at: Optional[datetime]
+
+    @classmethod
+    def from_job(cls, job) -> "JobState":
+        return cls(
+            id=job.id,
+            status=job.status,
+            priority=job.priority or 0,
+            estimated_duration=job.estimated_duration or 0,
+            consumed_seconds=job.consumed_seconds or 0,
+            started_at=job.started_at,
+        )
+
+    def remaining(self, now: datetime) -> float:
+        left = self.estimated_duration - self.consumed_seconds
+        if self.status == "RUNNING" and self.started_at is not None:
+            left -= (now - self.started_at).total_seconds()
+        return max(left, 0.0)
+
+@dataclass
+class Estimate:
+    job_id: int
+    status: str
+    queue_position: Optional[int]          # 0 یعنی در حال اجرا
+    estimated_wait_seconds: Optional[int]
+    estimated_start_at: Optional[datetime]
+    estimated_completion_at: Optional[datetime]
+
+class QueueModel:
+    """مدل صف (Thread-safe). نمونه اصلی در main.py ساخته می‌شود."""
+
+    def __init__(self, slots: int = TOTAL_SLOTS):
+        self.slots = max(slots, 1)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """پاک کردن مدل؛ Bootstrap در اولین استفاده دوباره انجام می‌شود."""
+        with self._lock:
+            self._jobs: Dict[int, JobState] = {}
+            self._ready = False
+            self._watermark: Optional[datetime] = None   # بیشترین status_changed_at دیده شده
+            self._last_sync = 0.0
+            self._last_full_sync = 0.0
+            self._schedule: Optional[Dict[int, Tuple[int, float, float]]] = None
+            self._schedule_at: Tuple[float, datetime] = (0.0, datetime.now())
+
+    # ---------- به‌روزرسانی مدل ----------
+
+    def apply(self, job) -> None:
+        """اعمال وضعیت جدید یک تسک (ORM یا JobState)؛ تسک‌های غیرفعال از مدل حذف می‌شوند."""
+        state = job if isinstance(job, JobState) else JobState.from_job(job)
+        with self._lock:
+            if state.status in ACTIVE_STATUSES:
+                self._jobs[state.id] = state
+            else:
+                self._jobs.pop(state.id, None)
+            self._schedule = None
+
+    def remove(self, job_id: int) -> None:
+        with self._lock:
+            if self._jobs.pop(job_id, None) is not None:
+                self._schedule = None
+
+    def _observe(self, changed_at: Optional[datetime]) -> None:
+        if changed_at is not None and (self._watermark is None or changed_at > self._watermark):
+            self._watermark = changed_at
+
+    def sync(self, db: Session, force: bool = False) -> None:
+        """
+        همگام‌سازی با دیتابیس.
+        بارگذاری کامل (اولین بار و هر FULL_RESYNC_INTERVAL ثانیه): تسک‌های فعال (با ایندکس status)
+        جایگزین کل مدل می‌شوند.
+        دفعات بعد (حداکثر هر SYNC_INTERVAL ثانیه): فقط ردیف‌هایی که status_changed_at آن‌ها
+        از (بیشترین مقدار دیده شده - SYNC_OVERLAP) بزرگ‌تر یا مساوی است.
+        """
+        now = time.monotonic()
+        if not force and self._ready and now - self._last_sync < SYNC_INTERVAL:
+            return
+        full = not self._ready or self._watermark is None or now - self._last_full_sync >= FULL_RESYNC_INTERVAL
+        query = db.query(models.Job)
+        if full:
+            query = query.filter(models.Job.status.in_(ACTIVE_STATUSES))
+        else:
+            query = query.filter(models.Job.status_changed_at >= self._watermark - SYNC_OVERLAP)
+        rows = query.all()
+        states = [JobState.from_job(job) for job in rows]
+        with self._lock:
+            if full:
+                self._jobs = {state.id: state for state in states}
+                self._schedule = None
+                self._last_full_sync = now
+            for job in rows:
+                self._observe(job.status_changed_at)
+            self._ready = True
+            self._last_sync = now
+        if not full:
+            for state in states:
+                self.apply(state)
+
+    # ---------- محاسبه برنامه زمانی ----------
+
+    def _build_schedule(self, now: datetime) -> Dict[int, Tuple[int, float, float]]:
+        """
+        شبیه‌سازی صف: اسلات‌ها با زمان باقی‌مانده تسک‌های در حال اجرا پر می‌شوند،
+        سپس تسک‌های منتظر به ترتیب (اولویت، شناسه) روی اولین اسلات آزاد قرار می‌گیرند.
+        خروجی: job_id -> (جایگاه در صف، ثانیه تا شروع، ثانیه تا پایان)
+        """
+        running = sorted(
+            (job for job in self._jobs.values() if job.status == "RUNNING"),
+            key=lambda job: job.remaining(now),
+        )
+        waiting = sorted(
+            (job for job in self._jobs.values() if job.status != "RUNNING"),
+            key=lambda job: (-job.priority, job.id),
+        )
+        schedule = {}
+        free_at = []
+        for job in running:
+            end = job.remaining(now)
+            schedule[job.id] = (0, 0.0, end)
+            free_at.append(end)
+        # اگر تعداد تسک‌های در حال اجرا بیشتر از ظرفیت اعلام شده باشد، ظرفیت واقعی بیشتر است.
+        free_at += [0.0] * (self.slots - len(free_at))
+        heapq.heapify(free_at)
+
+        for position, job in enumerate(waiting, start=1):
+            start = heapq.heappop(free_at)
+            end = start + job.remaining(now)
+            heapq.heappush(free_at, end)
+            schedule[job.id] = (position, start, end)
+        return schedule
+
+    def estimate(self, job_id: int, now: Optional[datetime] = None) -> Optional[Estimate]:
+        """پیش‌بینی زمان شروع و پایان یک تسک فعال (None اگر تسک در مدل نباشد)."""
+        now = now or datetime.now()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            built_mono, built_at = self._schedule_at
+            if self._schedule is None or time.monotonic() - built_mono > SCHEDULE_TTL:
+                self._schedule = self._build_schedule(now)
+                built_at = now
+                self._schedule_at = (time.monotonic(), now)
+            position, start, end = self._schedule[job_id]
+
+        # تصحیح بر اساس زمان سپری شده از محاسبه برنامه
+        drift = max((now - built_at).total_seconds(), 0.0)
+        wait = max(start - drift, 0.0)
+        left = max(end - drift, wait)
+        return Estimate(
+            job_id=job_id,
+            status=job.status,
+            queue_position=position,
+            estimated_wait_seconds=int(round(wait)),
+            estimated_start_at=job.started_at if position == 0 else now + timedelta(seconds=wait),
+            estimated_completion_at=now + timedelta(seconds=left),
+        )
+
+    def __len__(self) -> int:
+        return len(self._jobs)
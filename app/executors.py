@@ -0,0 +1,398 @@
+"""
+ماژول اجرای تسک‌ها (Execution Backends)
+---------------------------------------
+Worker اجرای واقعی دستور کاربر را به یک Backend قابل تعویض می‌سپارد:
+- SleepBackend: شبیه‌ساز قبلی (فقط به اندازه estimated_duration صبر می‌کند).
+- SubprocessBackend: اجرای دستور به صورت پروسه محلی، بدون Shell و با محدودیت منابع.
+
+انتخاب Backend با متغیر محیطی GPU_EXECUTION_BACKEND انجام می‌شود (پیش‌فرض: sleep).
+"""
+
+import asyncio
+import os
+import shlex
+import shutil
+import signal
+import sys
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple, Type
+
+from .job_logs import JobLog
+
+# ماژول resource فقط روی سیستم‌های یونیکسی وجود دارد.
+try:
+    import resource
+except ImportError:  # pragma: no cover - ویندوز
+    resource = None
+
+# توکن‌هایی که در Shell معنای خاص دارند؛ چون Shell اجرا نمی‌شود، وجودشان نشانه سوءاستفاده است.
+SHELL_OPERATORS = {";", "&", "&&", "|", "||", ">", ">>", "<", "<<", "2>", "2>&1", "&>"}
+SHELL_PATTERNS = ("`", "$(", "${")
+
+# محدودیت‌های منابع برای پروسه فرزند
+# سقف فضای آدرس (RLIMIT_AS) اختیاری است (۰ یعنی بدون سقف)، چون CUDA فضای آدرس مجازی بسیار
+# بزرگی رزرو می‌کند و هر سقف معقولی برنامه‌های GPU را از کار می‌اندازد.
+MEMORY_LIMIT_BYTES = int(os.environ.get("GPU_JOB_MEMORY_LIMIT", 0))
+OPEN_FILES_LIMIT = 256
+# ضریب مجاز اجرای بیشتر از زمان تخمینی قبل از Kill شدن (Wall-clock timeout)
+TIMEOUT_GRACE_FACTOR = 1.5
+# مهلت ذخیره Checkpoint پس از دریافت SIGTERM هنگام Preemption (ثانیه)
+CHECKPOINT_GRACE_SECONDS = 10
+CHECKPOINT_DIR = os.environ.get("GPU_CHECKPOINT_DIR", "./checkpoints")
+# پوشه کاری موقت هر تسک (زیرپوشه‌ای با storage_key)؛ تسک به پوشه جاری Worker (دیتابیس، لاگ‌ها) دسترسی نمی‌گیرد.
+SCRATCH_DIR = os.environ.get("GPU_JOB_SCRATCH_DIR", "./job_scratch")
+READ_CHUNK_SIZE = 64 * 1024
+# خط گزارش پیشرفت در خروجی تسک: "GPU_PROGRESS <درصد> [ثانیه‌های باقی‌مانده]"
+PROGRESS_MARKER = b"GPU_PROGRESS "
+# حداکثر طول خط ناقص انتهای هر تکه که برای یافتن خط پیشرفت نگه داشته می‌شود
+MAX_PROGRESS_LINE = 256
+
+# تابع گزارش پیشرفت: (درصد، ثانیه‌های باقی‌مانده)
+ProgressCallback = Callable[[float, Optional[int]], None]
+
+def _no_progress(percent: float, eta_seconds: Optional[int]) -> None:
+    pass
+
+def parse_progress_line(line: bytes) -> Optional[Tuple[float, Optional[int]]]:
+    """تجزیه خط "GPU_PROGRESS 42.5 120" به (42.5، 120)؛ خط نامعتبر None برمی‌گرداند."""
+    line = line.strip()
+    if not line.startswith(PROGRESS_MARKER):
+        return None
+    parts = line[len(PROGRESS_MARKER):].split()
+    if not 1 <= len(parts) <= 2:
+        return None
+    try:
+        percent = float(parts[0])
+        eta_seconds = int(float(parts[1])) if len(parts) == 2 else None
+    except ValueError:
+        return None
+    if not 0.0 <= percent <= 100.0:
+        return None
+    return percent, eta_seconds
+
+def checkpoint_path(storage_key: str) -> str:
+    """
+    مسیر Checkpoint یک تسک (به برنامه با GPU_CHECKPOINT_PATH داده می‌شود).
+    مثل لاگ‌ها با storage_key نام‌گذاری می‌شود تا به تسک دیگری با شناسه تکراری نرسد.
+    """
+    return os.path.abspath(os.path.join(CHECKPOINT_DIR, storage_key))
+
+# برنامه کوچکی که پیش از exec دستور کاربر محدودیت‌ها را روی پروسه خودش اعمال می‌کند
+# (argv: سقف فایل‌های باز، سقف فضای آدرس یا ۰، سپس دستور کاربر). خطای exec مثل Shell با کد ۱۲۷ تمام می‌شود.
+LIMITS_TRAMPOLINE = """
+import os, resource, sys
+nofile, address_space, argv = int(sys.argv[1]), int(sys.argv[2]), sys.argv[3:]
+limits = [(resource.RLIMIT_NOFILE, nofile)]
+if address_space > 0:
+    limits.append((resource.RLIMIT_AS, address_space))
+for which, value in limits:
+    try:
+        resource.setrlimit(which, (value, value))
+    except (OSError, ValueError) as e:
+        sys.stderr.write("[executor] could not apply resource limit %s: %s\\n" % (which, e))
+sys.stderr.flush()
+try:
+    os.execvp(argv[0], argv)
+except OSError as e:
+    sys.stderr.write("[executor] failed to start: %s\\n" % e)
+    sys.exit(127)
+"""
+
+def limited_argv(argv: List[str]) -> List[str]:
+    """
+    argv اجرای دستور از طریق LIMITS_TRAMPOLINE، تا محدودیت‌ها قبل از اجرای اولین دستور کاربر برقرار باشند
+    (prlimit پس از ساخت پروسه فاصله‌ای دارد و preexec_fn در پروسه چندترده Worker امن نیست).
+    """
+    if resource is None or not sys.executable:
+        return argv
+    return [sys.executable, "-I", "-S", "-c", LIMITS_TRAMPOLINE,
+            str(OPEN_FILES_LIMIT), str(max(MEMORY_LIMIT_BYTES, 0)), *argv]
+
+def scratch_path(storage_key: str) -> str:
+    """پوشه کاری موقت یک تسک؛ پس از پایان اجرا پاک می‌شود."""
+    return os.path.abspath(os.path.join(SCRATCH_DIR, storage_key))
+
+def remove_checkpoint(storage_key: str) -> None:
+    """حذف Checkpoint تسک پایان یافته یا حذف شده (فایل یا پوشه)."""
+    path = checkpoint_path(storage_key)
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def checkpoint_saved_at(path: str, since: float) -> Optional[float]:
+    """
+    زمان (ساعت دیواری) آخرین ذخیره در مسیر Checkpoint (فایل یا پوشه)، اگر از since به بعد باشد.
+    برای پوشه، آخرین زمان تغییر خود پوشه و فایل‌های داخل آن بررسی می‌شود.
+    """
+    try:
+        latest = os.stat(path).st_mtime
+        if os.path.isdir(path):
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    latest = max(latest, entry.stat().st_mtime)
+    except OSError:
+        return None
+    return latest if latest >= since else None
+
+class CommandError(ValueError):
+    """دستور کاربر قابل اجرا (یا امن) نیست."""
+
+def allowed_executables() -> Optional[set]:
+    """لیست سفید فایل‌های اجرایی (با کاما در GPU_ALLOWED_EXECUTABLES)؛ None یعنی بدون محدودیت."""
+    raw = os.environ.get("GPU_ALLOWED_EXECUTABLES", "").strip()
+    return {name.strip() for name in raw.split(",") if name.strip()} or None
+
+def parse_command(command: str) -> List[str]:
+    """
+    تبدیل رشته دستور به argv (بدون استفاده از Shell).
+
+    قوانین:
+    - نقل‌قول‌ها باید بسته شده باشند (shlex).
+    - کاراکترهای کنترلی (مثل newline یا NUL) مجاز نیستند.
+    - عملگرهای Shell (مثل ; | && > <) و جایگزینی دستور (` $( ${) رد می‌شوند.
+    - اگر لیست سفید تنظیم شده باشد، نام فایل اجرایی باید در آن باشد.
+    """
+    if any(ord(ch) < 32 and ch != "\t" for ch in command):
+        raise CommandError("کاراکتر کنترلی در دستور مجاز نیست.")
+    try:
+        argv = shlex.split(command, posix=True)
+    except ValueError as e:
+        raise CommandError(f"ساختار دستور نامعتبر است: {e}")
+    if not argv:
+        raise CommandError("دستور خالی است.")
+
+    for token in argv:
+        if token in SHELL_OPERATORS or any(p in token for p in SHELL_PATTERNS):
+            raise CommandError(f"عملگر Shell در دستور مجاز نیست: {token}")
+
+    allowed = allowed_executables()
+    if allowed is not None and os.path.basename(argv[0]) not in allowed:
+        raise CommandError(f"فایل اجرایی مجاز نیست: {argv[0]}")
+    return argv
+
+@dataclass
+class JobSpec:
+    """اطلاعات لازم برای اجرای یک تسک (مستقل از نشست دیتابیس)."""
+    id: int
+    command: str
+    estimated_duration: int
+    consumed_seconds: int = 0   # زمان اجرا شده در دفعات قبل (برای تسک‌های PREEMPTED)
+    priority: int = 0
+    preempt_count: int = 0
+    request_id: Optional[str] = None   # شناسه درخواست ثبت کننده (برای همبستگی لاگ‌ها)
+    approved_request_id: Optional[str] = None   # شناسه درخواست تایید کننده
+    storage_key: str = ""   # نام فایل‌های لاگ و Checkpoint (پیش‌فرض: job_<id>)
+
+    def __post_init__(self):
+        self.storage_key = self.storage_key or f"job_{self.id}"
+
+    @property
+    def remaining_seconds(self) -> int:
+        """زمانی که از سهمیه پرداخت شده تسک باقی مانده است."""
+        return max(self.estimated_duration - self.consumed_seconds, 1)
+
+    @classmethod
+    def from_job(cls, job) -> "JobSpec":
+        return cls(
+            id=job.id,
+            command=job.command,
+            estimated_duration=job.estimated_duration or 10,
+            consumed_seconds=job.consumed_seconds or 0,
+            priority=job.priority or 0,
+            preempt_count=job.preempt_count or 0,
+            request_id=getattr(job, "request_id", None),
+            approved_request_id=getattr(job, "approved_request_id", None),
+            storage_key=getattr(job, "storage_key", None) or "",
+        )
+
+class ExecutionBackend:
+    """
+    کلاس پایه Backendها. متد run کد خروج (Exit Code) را برمی‌گرداند؛ صفر یعنی موفق.
+    progress تابعی است که Backend برای گزارش درصد پیشرفت و ETA صدا می‌زند (بدون I/O).
+    """
+    name = "base"
+
+    async def run(self, job: JobSpec, log: JobLog, progress: ProgressCallback = _no_progress) -> int:
+        raise NotImplementedError
+
+    def checkpoint_time(self, job: JobSpec, since: float) -> Optional[float]:
+        """
+        زمان (ساعت دیواری) آخرین Checkpoint تسک متوقف شده که از since (شروع اجرای فعلی) به بعد ذخیره شده است.
+        فقط زمان اجرا تا همین لحظه از بودجه اجرای بعدی کم می‌شود (کار بعد از آن از دست رفته است)؛
+        None یعنی Checkpoint تازه‌ای نیست و تسک از ابتدا و با بودجه کامل دوباره اجرا می‌شود.
+        """
+        return None
+
+class SleepBackend(ExecutionBackend):
+    """
+    شبیه‌ساز: به اندازه estimated_duration ثانیه صبر می‌کند (رفتار قبلی Worker).
+    تسک متوقف شده (PREEMPTED) از همان ثانیه‌ای که متوقف شده بود ادامه پیدا می‌کند.
+    """
+    name = "sleep"
+
+    async def run(self, job: JobSpec, log: JobLog, progress: ProgressCallback = _no_progress) -> int:
+        total = job.estimated_duration
+        done = min(job.consumed_seconds, total)
+        if done:
+            await log.write(f"[simulator] resuming at {done}/{total}s\n".encode())
+        else:
+            await log.write(f"[simulator] {job.command}\n".encode())
+        for second in range(done + 1, total + 1):
+            await asyncio.sleep(1)
+            progress(100.0 * second / total, total - second)
+        await log.write(f"[simulator] finished after {job.estimated_duration}s\n".encode())
+        return 0
+
+    def checkpoint_time(self, job: JobSpec, since: float) -> Optional[float]:
+        # شبیه‌ساز دقیقاً از ثانیه توقف ادامه می‌دهد.
+        return time.time()
+
+class SubprocessBackend(ExecutionBackend):
+    """
+    اجرای دستور به صورت پروسه محلی.
+    - بدون Shell (create_subprocess_exec) و با argv حاصل از parse_command.
+    - محدودیت تعداد فایل‌های باز و در صورت تنظیم GPU_JOB_MEMORY_LIMIT، فضای آدرس
+      (پیش از exec دستور و با LIMITS_TRAMPOLINE؛ preexec_fn در پروسه چندترده Worker امن نیست).
+    - پوشه کاری هر تسک یک پوشه موقت جدا (scratch_path) است، مگر GPU_JOB_WORKDIR پوشه مشترکی تعیین کند.
+      زمان CPU محدود نمی‌شود (RLIMIT_CPU مجموع تمام تردهاست)؛ سقف زمان اجرا همان Timeout دیواری است.
+    - stdout و stderr در یک جریان ادغام و به صورت تکه‌ای در لاگ چرخشی نوشته می‌شوند.
+    - در صورت عبور از زمان مجاز، کل گروه پروسه Kill می‌شود.
+    - پیشرفت: برنامه می‌تواند خط‌های "GPU_PROGRESS <درصد> [ثانیه‌های باقی‌مانده]" در stdout چاپ کند
+      (متغیر GPU_PROGRESS_MARKER همین پیشوند را به برنامه می‌دهد). تا وقتی برنامه گزارشی نداده،
+      پیشرفت بر اساس زمان سپری شده نسبت به estimated_duration تخمین زده می‌شود (حداکثر ۹۹٪).
+    - Preemption: ابتدا SIGTERM ارسال می‌شود تا برنامه در GPU_CHECKPOINT_PATH وضعیت خود را ذخیره کند؛
+      پس از CHECKPOINT_GRACE_SECONDS پروسه Kill می‌شود. فقط اگر در این مسیر Checkpoint تازه‌ای
+      ذخیره شده باشد، اجرای بعدی با GPU_RESUMED=1 و بودجه باقی‌مانده ادامه می‌دهد؛ وگرنه از ابتدا
+      و با بودجه کامل اجرا می‌شود.
+    """
+    name = "subprocess"
+
+    def __init__(self, workdir: Optional[str] = None):
+        # None یعنی پوشه موقت جدا برای هر تسک
+        self.workdir = workdir or os.environ.get("GPU_JOB_WORKDIR") or None
+
+    async def run(self, job: JobSpec, log: JobLog, progress: ProgressCallback = _no_progress) -> int:
+        if self.workdir is not None:
+            return await self._run(job, log, progress, self.workdir)
+        workdir = scratch_path(job.storage_key)
+        os.makedirs(workdir, mode=0o700, exist_ok=True)
+        try:
+            return await self._run(job, log, progress, workdir)
+        finally:
+            await asyncio.shield(asyncio.to_thread(shutil.rmtree, workdir, True))
+
+    async def _run(self, job: JobSpec, log: JobLog, progress: ProgressCallback, workdir: str) -> int:
+        try:
+            argv = parse_command(job.command)
+        except CommandError as e:
+            await log.write(f"[executor] rejected: {e}\n".encode())
+            return 126
+
+        env = {
+            "PATH": os.environ.get("PATH", "/usr/bin:/bin"),
+            "GPU_JOB_ID": str(job.id),
+            "GPU_CHECKPOINT_PATH": checkpoint_path(job.storage_key),
+            "GPU_RESUMED": "1" if job.consumed_seconds and os.path.exists(checkpoint_path(job.storage_key)) else "0",
+            "GPU_PROGRESS_MARKER": PROGRESS_MARKER.decode().strip(),
+        }
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *limited_argv(argv),
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+                cwd=workdir,
+                env=env,
+                start_new_session=True,  # گروه پروسه جدا برای Kill کردن فرزندان
+            )
+        except OSError as e:
+            await log.write(f"[executor] failed to start: {e}\n".encode())
+            return 127
+
+        reported = False
+
+        async def pump() -> None:
+            nonlocal reported
+            tail = b""  # خط ناقص انتهای تکه قبلی
+            while True:
+                chunk = await proc.stdout.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                await log.write(chunk)
+                data = tail + chunk
+                last_newline = data.rfind(b"\n")
+                tail = data[last_newline + 1:][-MAX_PROGRESS_LINE:]
+                if last_newline < 0 or PROGRESS_MARKER not in data:
+                    continue
+                for line in data[:last_newline].split(b"\n"):
+                    parsed = parse_progress_line(line)
+                    if parsed is not None:
+                        reported = True
+                        progress(*parsed)
+
+        async def tick() -> None:
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            total = max(job.estimated_duration, 1)
+            while True:
+                await asyncio.sleep(1)
+                if reported:
+                    return  # برنامه خودش پیشرفت را گزارش می‌دهد
+                done = job.consumed_seconds + loop.time() - started
+                progress(min(99.0, 100.0 * done / total), max(total - done, 0))
+
+        timeout = job.remaining_seconds * TIMEOUT_GRACE_FACTOR + 1
+        ticker = asyncio.create_task(tick())
+        try:
+            await asyncio.wait_for(asyncio.gather(pump(), proc.wait()), timeout=timeout)
+        except asyncio.TimeoutError:
+            await log.write(f"[executor] timeout after {timeout:.0f}s, killing\n".encode())
+            self._kill(proc)
+            await proc.wait()
+        except asyncio.CancelledError:
+            # توقف از بیرون (Preemption یا خاموش شدن Worker): فرصت ذخیره Checkpoint
+            await asyncio.shield(self._terminate(proc))
+            raise
+        finally:
+            ticker.cancel()
+        return proc.returncode
+
+    async def _terminate(self, proc) -> None:
+        """ارسال SIGTERM و در صورت پایان نیافتن در مهلت Checkpoint، ارسال SIGKILL."""
+        try:
+            os.killpg(proc.pid, signal.SIGTERM)
+        except (ProcessLookupError, PermissionError):
+            pass
+        try:
+            await asyncio.wait_for(proc.wait(), timeout=CHECKPOINT_GRACE_SECONDS)
+        except asyncio.TimeoutError:
+            self._kill(proc)
+            await proc.wait()
+
+    def checkpoint_time(self, job: JobSpec, since: float) -> Optional[float]:
+        return checkpoint_saved_at(checkpoint_path(job.storage_key), since)
+
+    @staticmethod
+    def _kill(proc) -> None:
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+BACKENDS: Dict[str, Type[ExecutionBackend]] = {
+    SleepBackend.name: SleepBackend,
+    SubprocessBackend.name: SubprocessBackend,
+}
+
+def get_backend(name: Optional[str] = None) -> ExecutionBackend:
+    """ساخت Backend بر اساس نام (یا متغیر محیطی GPU_EXECUTION_BACKEND)."""
+    name = name or os.environ.get("GPU_EXECUTION_BACKEND", "sleep")
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown execution backend: {name} (available: {', '.join(BACKENDS)})")
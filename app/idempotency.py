@@ -0,0 +1,111 @@
+"""
+ماژول جلوگیری از ثبت تکراری (Idempotency & Duplicate Detection)
+---------------------------------------------------------------
+1. کلید Idempotency: کلاینت با هدر Idempotency-Key می‌تواند یک درخواست را چند بار بفرستد؛
+   فقط بار اول اجرا می‌شود و دفعات بعد همان پاسخ اول را (بدون هیچ نوشتنی در دیتابیس) می‌گیرند.
+   کلیدها در یک حافظه محدود (LRU) با زمان انقضا (TTL) نگه داشته می‌شوند.
+2. هش محتوا: اثر انگشت (owner, gpu_type, gpu_count, command) برای تشخیص درخواست تکراری
+   در میان تسک‌های فعال یک کاربر (اختیاری، با GPU_DEDUPE_ACTIVE_JOBS=1).
+   یکتایی را ایندکس جزئی uq_jobs_active_content_hash در دیتابیس تضمین می‌کند (نه فقط بررسی قبل از INSERT).
+
+نکته: این حافظه مخصوص هر پروسه است؛ در اجرای چند پروسه‌ای API، هر پروسه کلیدهای خودش را دارد.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Optional, Tuple
+
+# تنظیمات پیش‌فرض حافظه کلیدها
+MAX_ENTRIES = int(os.environ.get("GPU_IDEMPOTENCY_MAX_KEYS", 10000))
+TTL_SECONDS = int(os.environ.get("GPU_IDEMPOTENCY_TTL", 24 * 3600))
+MAX_KEY_LENGTH = 255
+# تشخیص تسک تکراری بر اساس محتوا (پیش‌فرض غیرفعال)
+DEDUPE_ACTIVE_JOBS = os.environ.get("GPU_DEDUPE_ACTIVE_JOBS", "0") == "1"
+
+# وضعیت‌های خروجی begin
+NEW, REPLAY, CONFLICT, IN_FLIGHT = "new", "replay", "conflict", "in_flight"
+
+def fingerprint(payload: dict) -> str:
+    """هش پایدار (SHA-256) از بدنه درخواست؛ ترتیب کلیدها تاثیری ندارد."""
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def job_content_hash(owner_id: int, gpu_type: str, gpu_count: int, command: str) -> str:
+    """اثر انگشت محتوای یک تسک برای تشخیص تکراری بودن در میان تسک‌های فعال."""
+    return fingerprint({"owner": owner_id, "gpu_type": gpu_type, "gpu_count": gpu_count, "command": command})
+
+@dataclass
+class IdempotencyEntry:
+    fingerprint: str
+    created_at: float
+    status_code: Optional[int] = None   # None یعنی درخواست اصلی هنوز در حال اجراست
+    body: Any = None
+
+class IdempotencyStore:
+    """
+    حافظه محدود کلیدهای Idempotency (Thread-safe).
+    کلید هر رکورد (user_id, idempotency_key) است تا کلید یک کاربر روی کاربر دیگر اثر نگذارد.
+    فقط پاسخ‌های موفق ذخیره می‌شوند؛ اگر درخواست اصلی خطا بدهد، کلید آزاد می‌شود تا
+    کلاینت بتواند پس از رفع مشکل (مثلاً آزاد شدن سهمیه) دوباره تلاش کند.
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, ttl_seconds: float = TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple[int, str], IdempotencyEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now: float) -> None:
+        # رکوردها به ترتیب زمان ثبت هستند، پس منقضی‌ها همیشه در ابتدای لیست قرار دارند.
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if now - entry.created_at < self.ttl_seconds and len(self._entries) <= self.max_entries:
+                break
+            self._entries.popitem(last=False)
+
+    def begin(self, user_id: int, key: str, request_fingerprint: str,
+              now: Optional[float] = None) -> Tuple[str, Optional[IdempotencyEntry]]:
+        """
+        شروع پردازش یک درخواست دارای کلید.
+        خروجی:
+        - (NEW, None): کلید رزرو شد؛ درخواست باید اجرا و سپس complete یا abandon شود.
+        - (REPLAY, entry): پاسخ ذخیره شده باید برگردانده شود.
+        - (CONFLICT, entry): همین کلید قبلاً با بدنه متفاوت استفاده شده است.
+        - (IN_FLIGHT, entry): درخواست اصلی هنوز در حال اجراست.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._evict(now)
+            entry = self._entries.get((user_id, key))
+            if entry is None:
+                self._entries[(user_id, key)] = IdempotencyEntry(request_fingerprint, now)
+                self._evict(now)
+                return NEW, None
+            if entry.fingerprint != request_fingerprint:
+                return CONFLICT, entry
+            if entry.status_code is None:
+                return IN_FLIGHT, entry
+            return REPLAY, entry
+
+    def complete(self, user_id: int, key: str, status_code: int, body: Any) -> None:
+        """ذخیره پاسخ موفق برای ارسال مجدد به درخواست‌های تکراری."""
+        with self._lock:
+            entry = self._entries.get((user_id, key))
+            if entry is not None:
+                entry.status_code = status_code
+                entry.body = body
+
+    def abandon(self, user_id: int, key: str) -> None:
+        """آزاد کردن کلید رزرو شده (وقتی درخواست اصلی با خطا تمام شده است)."""
+        with self._lock:
+            entry = self._entries.get((user_id, key))
+            if entry is not None and entry.status_code is None:
+                del self._entries[(user_id, key)]
+
+    def __len__(self) -> int:
+        return len(self._entries)
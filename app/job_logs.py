@@ -0,0 +1,156 @@
+"""
+ماژول لاگ خروجی تسک‌ها (Job Output Logs)
+----------------------------------------
+وظایف:
+1. نوشتن خروجی (stdout/stderr) تسک‌ها در فایل‌های چرخشی با سقف حجم (Rotating, Size-Capped).
+2. خواندن بازه‌ای (Range Read) از لاگ برای اندپوینت GET /jobs/{id}/logs.
+
+فایل‌ها با کلید ذخیره‌سازی تسک (Job.storage_key) نام‌گذاری می‌شوند، نه شناسه آن؛ چون شناسه تسک
+حذف شده ممکن است دوباره استفاده شود و لاگ کاربر قبلی نباید به تسک جدید برسد. برای کلید K:
+- K.log       : فایل فعلی
+- K.log.1..N  : فایل‌های قدیمی‌تر (عدد بزرگ‌تر = قدیمی‌تر)
+- K.log.base  : تعداد بایت‌هایی که به دلیل چرخش دور ریخته شده‌اند.
+
+آفست‌ها منطقی (Logical) هستند: بایت شماره X همیشه به همان محتوا اشاره می‌کند،
+حتی اگر بخش‌های قدیمی‌تر در اثر چرخش حذف شده باشند. این کار حالت Follow را ساده می‌کند.
+"""
+
+import asyncio
+import os
+from typing import List, Tuple
+
+# پوشه ذخیره لاگ‌ها (قابل تنظیم با متغیر محیطی)
+LOG_DIR = os.environ.get("GPU_JOB_LOG_DIR", "./job_logs")
+# حداکثر حجم هر فایل و تعداد فایل‌های قدیمی نگه داشته شده
+MAX_BYTES = int(os.environ.get("GPU_JOB_LOG_MAX_BYTES", 1024 * 1024))
+BACKUP_COUNT = int(os.environ.get("GPU_JOB_LOG_BACKUPS", 3))
+
+def log_path(key: str) -> str:
+    return os.path.join(LOG_DIR, f"{key}.log")
+
+def _segments(key: str) -> List[str]:
+    """لیست فایل‌های موجود یک تسک، از قدیمی‌ترین به جدیدترین."""
+    path = log_path(key)
+    older = [f"{path}.{i}" for i in range(BACKUP_COUNT, 0, -1)]
+    return [p for p in older + [path] if os.path.exists(p)]
+
+def _read_base(key: str) -> int:
+    try:
+        with open(log_path(key) + ".base") as f:
+            return int(f.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+class RotatingLogFile:
+    """
+    نویسنده همزمان (Synchronous) لاگ یک تسک با چرخش بر اساس حجم.
+    این کلاس مستقیماً در حلقه رویداد استفاده نمی‌شود؛ JobLog آن را در Thread صدا می‌زند.
+    """
+
+    def __init__(self, key: str, max_bytes: int = None, backup_count: int = None):
+        self.key = key
+        self.max_bytes = max_bytes or MAX_BYTES
+        self.backup_count = BACKUP_COUNT if backup_count is None else backup_count
+        self.path = log_path(key)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._file = open(self.path, "ab")
+        self._size = self._file.tell()
+
+    def write(self, data: bytes) -> None:
+        while data:
+            room = self.max_bytes - self._size
+            if room <= 0:
+                self._rotate()
+                continue
+            chunk, data = data[:room], data[room:]
+            self._file.write(chunk)
+            self._size += len(chunk)
+        self._file.flush()
+
+    def _rotate(self) -> None:
+        """جابجایی فایل‌ها: log -> log.1 -> log.2 ...؛ قدیمی‌ترین فایل حذف می‌شود."""
+        self._file.close()
+        discarded = 0
+        oldest = f"{self.path}.{self.backup_count}" if self.backup_count else self.path
+        if os.path.exists(oldest):
+            discarded = os.path.getsize(oldest)
+            os.remove(oldest)
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backup_count and os.path.exists(self.path):
+            os.replace(self.path, f"{self.path}.1")
+        if discarded:
+            base = _read_base(self.key) + discarded
+            with open(self.path + ".base", "w") as f:
+                f.write(str(base))
+        self._file = open(self.path, "ab")
+        self._size = 0
+
+    def close(self) -> None:
+        self._file.close()
+
+class JobLog:
+    """
+    رابط غیرمسدودکننده (Non-blocking) لاگ برای استفاده در حلقه رویداد Worker.
+    هر نوشتن در Thread Pool انجام می‌شود، بنابراین کندی دیسک فقط همان تسک را
+    (از طریق backpressure روی pipe) کند می‌کند و سایر اسلات‌ها درگیر نمی‌شوند.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self._file = None
+
+    async def open(self) -> "JobLog":
+        self._file = await asyncio.to_thread(RotatingLogFile, self.key)
+        return self
+
+    async def write(self, data: bytes) -> None:
+        if data:
+            await asyncio.to_thread(self._file.write, data)
+
+    async def aclose(self) -> None:
+        if self._file is not None:
+            await asyncio.to_thread(self._file.close)
+            self._file = None
+
+def delete_log(key: str) -> None:
+    """حذف تمام فایل‌های لاگ یک تسک (هنگام حذف تسک)."""
+    path = log_path(key)
+    for p in _segments(key) + [path + ".base"]:
+        try:
+            os.remove(p)
+        except FileNotFoundError:
+            pass
+
+def log_size(key: str) -> int:
+    """آفست منطقی انتهای لاگ (کل بایت‌های نوشته شده تا کنون)."""
+    return _read_base(key) + sum(os.path.getsize(p) for p in _segments(key))
+
+def read_log(key: str, offset: int = 0, limit: int = 64 * 1024) -> Tuple[bytes, int, int]:
+    """
+    خواندن بازه [offset, offset + limit) از لاگ منطقی.
+
+    اگر offset به بخشی اشاره کند که در اثر چرخش حذف شده، خواندن از قدیمی‌ترین
+    بایت موجود شروع می‌شود.
+    خروجی: (داده، آفست شروع واقعی، آفست انتهای لاگ)
+    """
+    base = _read_base(key)
+    segments = [(p, os.path.getsize(p)) for p in _segments(key)]
+    end = base + sum(size for _, size in segments)
+    start = min(max(offset, base), end)
+
+    chunks, remaining, position = [], max(limit, 0), base
+    for path, size in segments:
+        if remaining <= 0:
+            break
+        if start < position + size:
+            local = max(start - position, 0)
+            with open(path, "rb") as f:
+                f.seek(local)
+                data = f.read(min(size - local, remaining))
+            chunks.append(data)
+            remaining -= len(data)
+        position += size
+    return b"".join(chunks), start, end
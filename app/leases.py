@@ -0,0 +1,262 @@
+"""
+ماژول اجاره و بازیابی تسک‌ها (Worker Heartbeats & Job Leases)
+-------------------------------------------------------------
+وظایف:
+1. ثبت Worker و ارسال ضربان قلب (Heartbeat) دوره‌ای.
+2. برداشتن اتمیک تسک بعدی صف (APPROVED یا PREEMPTED، به ترتیب اولویت) به همراه اجاره (Lease) قابل تمدید.
+3. Reaper: پیدا کردن اجاره‌های منقضی شده (Worker از کار افتاده) و برگرداندن تسک به صف
+   یا FAILED کردن آن پس از چند تلاش ناموفق.
+4. Preemption: برداشتن تسک منتظر برای اسلاتی که آزاد می‌شود (min_priority)، سپس متوقف کردن
+   تسک در حال اجرا و برگرداندن آن به صف با وضعیت PREEMPTED.
+
+نکته: تمدید اجاره‌ها با یک دستور UPDATE برای تمام تسک‌های یک Worker انجام می‌شود،
+پس هزینه Heartbeat به تعداد تسک‌ها وابسته نیست.
+"""
+
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Set, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from . import models, database
+from .scheduler import QUEUED_STATUSES
+
+# فاصله ارسال ضربان قلب (ثانیه)
+HEARTBEAT_INTERVAL = 10
+# مدت اعتبار اجاره؛ باید چند برابر HEARTBEAT_INTERVAL باشد تا تاخیرهای کوتاه باعث بازیابی اشتباه نشوند.
+LEASE_TTL = 30
+# فاصله اجرای Reaper (ثانیه)
+REAP_INTERVAL = 15
+# حداکثر تعداد شروع اجرای یک تسک؛ پس از آن تسک FAILED می‌شود.
+MAX_ATTEMPTS = 3
+
+def register_worker(db: Session, worker_id: str, hostname: str, pid: int) -> models.Worker:
+    """ثبت (یا به‌روزرسانی) Worker در جدول workers."""
+    now = datetime.now()
+    worker = db.query(models.Worker).filter(models.Worker.id == worker_id).first()
+    if worker is None:
+        worker = models.Worker(id=worker_id, hostname=hostname, pid=pid, started_at=now)
+        db.add(worker)
+    worker.last_heartbeat = now
+    db.commit()
+    return worker
+
+def heartbeat(db: Session, worker_id: str, job_ids: Optional[Iterable[int]] = None,
+              now: Optional[datetime] = None) -> Set[int]:
+    """
+    ارسال ضربان قلب و تمدید اجاره‌های این Worker.
+    job_ids تسک‌هایی است که Worker واقعاً در حال اجرای آن‌هاست (None یعنی همه اجاره‌ها)؛ اجاره‌ای
+    که هیچ اسلاتی آن را اجرا نمی‌کند (مثلاً ثبت نتیجه‌اش شکست خورده) تمدید نمی‌شود تا Reaper آن را بازیابی کند.
+    خروجی: شناسه تسک‌هایی که اجاره‌شان هنوز متعلق به این Worker است و تمدید شد.
+    تسکی که در حال اجراست ولی در این مجموعه نیست اجاره‌اش را از دست داده
+    (Reaper آن را به صف برگردانده یا کاربر آن را حذف کرده) و Worker باید اجرای آن را متوقف کند.
+    """
+    now = now or datetime.now()
+    db.query(models.Worker).filter(models.Worker.id == worker_id).update(
+        {models.Worker.last_heartbeat: now}, synchronize_session=False
+    )
+    owned = db.query(models.JobLease).filter(models.JobLease.worker_id == worker_id)
+    if job_ids is not None:
+        owned = owned.filter(models.JobLease.job_id.in_(list(job_ids)))
+    owned.update({models.JobLease.expires_at: now + timedelta(seconds=LEASE_TTL)}, synchronize_session=False)
+    renewed = {job_id for (job_id,) in owned.with_entities(models.JobLease.job_id).all()}
+    db.commit()
+    return renewed
+
+def claim_next_job(db: Session, worker_id: str, now: Optional[datetime] = None,
+                   min_priority: Optional[int] = None) -> Optional[models.Job]:
+    """
+    برداشتن تسک بعدی صف به صورت اتمیک: اولویت بالاتر اول، و در اولویت یکسان قدیمی‌تر اول (FIFO).
+    تسک‌های PREEMPTED هم در همین صف هستند و از نقطه توقف ادامه داده می‌شوند.
+    با min_priority فقط تسکی با حداقل این اولویت برداشته می‌شود (رزرو تسک منتظر پیش از Preemption).
+
+    مسیر اجرا بر اساس نوع دیتابیس انتخاب می‌شود:
+    - PostgreSQL: SELECT ... FOR UPDATE SKIP LOCKED؛ Workerهای همزمان ردیف‌های قفل شده
+      را رد می‌کنند و هر کدام بدون رقابت تسک متفاوتی برمی‌دارند.
+    - SQLite: UPDATE شرطی (Compare-and-Set)؛ اگر Worker دیگری همزمان همین تسک را
+      برداشته باشد، rowcount صفر است و تسک بعدی امتحان می‌شود.
+    """
+    now = now or datetime.now()
+    if database.supports_skip_locked(db):
+        return _claim_skip_locked(db, worker_id, now, min_priority)
+    return _claim_compare_and_set(db, worker_id, now, min_priority)
+
+def _queue_order(query, min_priority: Optional[int] = None):
+    query = query.filter(models.Job.status.in_(QUEUED_STATUSES))
+    if min_priority is not None:
+        query = query.filter(models.Job.priority >= min_priority)
+    return query.order_by(models.Job.priority.desc(), models.Job.id)
+
+def _start_values(resumed: bool, now: datetime) -> dict:
+    """مقادیر مشترک شروع اجرا (برای هر دو مسیر برداشتن تسک)."""
+    values = {
+        models.Job.status: "RUNNING",
+        models.Job.status_changed_at: now,
+        models.Job.started_at: now,
+        models.Job.attempts: models.Job.attempts + 1,
+        models.Job.eta_seconds: models.Job.estimated_duration - models.Job.consumed_seconds,
+    }
+    if not resumed:
+        # تسک ادامه‌دار پیشرفت قبلی خود را حفظ می‌کند.
+        values[models.Job.progress] = 0.0
+    return values
+
+def _add_lease(db: Session, job_id: int, worker_id: str, now: datetime) -> None:
+    db.add(models.JobLease(
+        job_id=job_id, worker_id=worker_id, expires_at=now + timedelta(seconds=LEASE_TTL)
+    ))
+
+def skip_locked_candidate(db: Session, min_priority: Optional[int] = None):
+    """کوئری قفل کردن اولین تسک آزاد صف (FOR UPDATE SKIP LOCKED)."""
+    return _queue_order(db.query(models.Job.id, models.Job.status), min_priority).limit(1).with_for_update(
+        skip_locked=True
+    )
+
+def _claim_skip_locked(db: Session, worker_id: str, now: datetime,
+                       min_priority: Optional[int] = None) -> Optional[models.Job]:
+    for _ in range(5):
+        row = skip_locked_candidate(db, min_priority).first()
+        if row is None:
+            break
+        job_id, current_status = row
+        # در PostgreSQL ردیف تا پایان تراکنش قفل است و شرط وضعیت همیشه برقرار است؛ شرط فقط
+        # دیتابیس‌هایی را پوشش می‌دهد که FOR UPDATE را نادیده می‌گیرند (مثل SQLite در تست‌ها).
+        claimed = db.query(models.Job).filter(
+            models.Job.id == job_id, models.Job.status == current_status
+        ).update(_start_values(current_status == "PREEMPTED", now), synchronize_session=False)
+        if claimed != 1:
+            db.rollback()
+            continue
+        _add_lease(db, job_id, worker_id, now)
+        db.commit()
+        return db.query(models.Job).filter(models.Job.id == job_id).first()
+    db.rollback()
+    return None
+
+def _claim_compare_and_set(db: Session, worker_id: str, now: datetime,
+                           min_priority: Optional[int] = None) -> Optional[models.Job]:
+    candidates = _queue_order(db.query(models.Job.id, models.Job.status), min_priority).limit(5).all()
+    for job_id, current_status in candidates:
+        claimed = db.query(models.Job).filter(
+            models.Job.id == job_id, models.Job.status == current_status
+        ).update(_start_values(current_status == "PREEMPTED", now), synchronize_session=False)
+        if claimed != 1:
+            continue
+        _add_lease(db, job_id, worker_id, now)
+        db.commit()
+        return db.query(models.Job).filter(models.Job.id == job_id).first()
+    db.rollback()
+    return None
+
+def peek_waiting_priority(db: Session) -> Optional[int]:
+    """بالاترین اولویت در میان تسک‌های منتظر (با ایندکس status/priority، بدون پیمایش جدول)."""
+    return db.query(func.max(models.Job.priority)).filter(
+        models.Job.status.in_(QUEUED_STATUSES)
+    ).scalar()
+
+def _release(db: Session, job_id: int, worker_id: str) -> bool:
+    released = db.query(models.JobLease).filter(
+        models.JobLease.job_id == job_id, models.JobLease.worker_id == worker_id
+    ).delete(synchronize_session=False)
+    if released != 1:
+        db.rollback()
+        return False
+    return True
+
+def finish_job(db: Session, job_id: int, worker_id: str, status: str = "COMPLETED",
+               elapsed_seconds: int = 0) -> bool:
+    """
+    پایان اجرای تسک و آزاد کردن اجاره.
+
+    اگر اجاره دیگر متعلق به این Worker نباشد (مثلاً توسط Reaper بازیابی شده)
+    یا وضعیت تسک توسط ادمین تغییر کرده باشد، وضعیت بازنویسی نمی‌شود و False برمی‌گردد.
+    """
+    if not _release(db, job_id, worker_id):
+        return False
+    now = datetime.now()
+    db.query(models.Job).filter(
+        models.Job.id == job_id, models.Job.status == "RUNNING"
+    ).update(
+        {
+            models.Job.status: status,
+            models.Job.status_changed_at: now,
+            models.Job.completed_at: now,
+            models.Job.progress: 100.0 if status == "COMPLETED" else models.Job.progress,
+            models.Job.eta_seconds: None,
+            models.Job.consumed_seconds: models.Job.consumed_seconds + int(elapsed_seconds),
+        },
+        synchronize_session=False,
+    )
+    db.commit()
+    return True
+
+def preempt_job(db: Session, job_id: int, worker_id: str, elapsed_seconds: int,
+                checkpointed: bool = True) -> bool:
+    """
+    توقف تسک در حال اجرا برای باز کردن جا (Preemption).
+    اگر تسک Checkpoint ذخیره کرده باشد (checkpointed)، elapsed_seconds (زمان اجرا تا آن Checkpoint) به consumed_seconds اضافه می‌شود
+    تا اجرای بعدی فقط باقی‌مانده را اجرا کند و در صورت حذف تسک فقط سهمیه مصرف نشده برگردد.
+    در غیر این صورت کار انجام شده از دست رفته است: نه از بودجه اجرای بعدی کم می‌شود و نه از کاربر.
+    """
+    if not _release(db, job_id, worker_id):
+        return False
+    values = {
+        models.Job.status: "PREEMPTED",
+        models.Job.status_changed_at: datetime.now(),
+        models.Job.started_at: None,
+        models.Job.eta_seconds: None,
+        models.Job.preempt_count: models.Job.preempt_count + 1,
+    }
+    if checkpointed:
+        values[models.Job.consumed_seconds] = models.Job.consumed_seconds + int(elapsed_seconds)
+    else:
+        values[models.Job.progress] = 0.0
+    db.query(models.Job).filter(
+        models.Job.id == job_id, models.Job.status == "RUNNING"
+    ).update(values, synchronize_session=False)
+    db.commit()
+    return True
+
+def reap_expired_leases(db: Session, now: Optional[datetime] = None) -> List[Tuple[int, str]]:
+    """
+    بازیابی تسک‌های یتیم (Orphaned RUNNING Jobs).
+
+    فقط جدول کوچک job_leases با ایندکس expires_at پیمایش می‌شود.
+    - اگر تسک هنوز سهمیه تلاش مجدد دارد: به صف برمی‌گردد (APPROVED).
+    - در غیر این صورت: FAILED می‌شود.
+    خروجی: لیست (job_id, وضعیت جدید).
+    """
+    now = now or datetime.now()
+    expired = (
+        db.query(models.JobLease)
+        .filter(models.JobLease.expires_at < now)
+        .order_by(models.JobLease.expires_at)
+        .all()
+    )
+    results = []
+    for lease in expired:
+        # حذف شرطی: اگر Worker در همین لحظه اجاره را تمدید کرده باشد، دست نمی‌زنیم.
+        removed = db.query(models.JobLease).filter(
+            models.JobLease.job_id == lease.job_id, models.JobLease.expires_at < now
+        ).delete(synchronize_session=False)
+        if removed != 1:
+            continue
+
+        job = db.query(models.Job).filter(models.Job.id == lease.job_id).first()
+        if job is None or job.status != "RUNNING":
+            continue
+        job.status_changed_at = now
+        if (job.attempts or 0) < MAX_ATTEMPTS:
+            job.status = "APPROVED"
+            job.started_at = None
+            job.progress = 0.0
+            job.eta_seconds = None
+        else:
+            job.status = "FAILED"
+            job.completed_at = now
+        results.append((job.id, job.status))
+    db.commit()
+    return results
+
+def release_job_lease(db: Session, job_id: int) -> None:
+    """حذف اجاره یک تسک (مثلاً هنگام حذف تسک توسط کاربر). commit بر عهده فراخواننده است."""
+    db.query(models.JobLease).filter(models.JobLease.job_id == job_id).delete(synchronize_session=False)
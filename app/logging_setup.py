@@ -0,0 +1,230 @@
+"""
+ماژول لاگ ساختاریافته (Structured Logging)
+-----------------------------------------
+جایگزین print() در API و Worker:
+1. هر رکورد یک خط JSON است با فیلدهای ثابت (ts, level, service, event) و شناسه‌های
+   request_id، job_id و user_id که از contextvars یا آرگومان‌های رویداد خوانده می‌شوند.
+2. غیرمسدودکننده (Non-blocking): مسیرهای پرتکرار فقط رکورد را در یک صف محدود قرار می‌دهند؛
+   نوشتن روی stdout در ترد جداگانه QueueListener انجام می‌شود. اگر صف پر باشد رکورد
+   دور ریخته و شمارش می‌شود (فراخواننده هرگز منتظر I/O نمی‌ماند).
+3. نمونه‌برداری (Sampling) بر اساس دسته رویداد: برای رویدادهای پرحجم (مثل access یا progress)
+   فقط یک رکورد از هر N رکورد نوشته می‌شود. هشدارها و خطاها همیشه نوشته می‌شوند.
+   تنظیم با GPU_LOG_SAMPLE، مثلاً "access=0.1,progress=0.05".
+4. همبستگی (Correlation): request_id درخواست ثبت تسک روی خود تسک ذخیره می‌شود و Worker
+   هنگام اجرای تسک همان شناسه را در لاگ‌هایش قرار می‌دهد.
+"""
+
+import atexit
+import contextvars
+import itertools
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+# پیشوند نام تمام Loggerهای پروژه (مثلاً gpu_service.worker)
+ROOT_LOGGER = "gpu_service"
+LOG_LEVEL = os.environ.get("GPU_LOG_LEVEL", "INFO").upper()
+# ظرفیت صف رکوردها؛ در صورت پر شدن، رکوردهای جدید دور ریخته می‌شوند.
+QUEUE_SIZE = int(os.environ.get("GPU_LOG_QUEUE_SIZE", 10000))
+# نرخ پیش‌فرض نمونه‌برداری هر دسته (۱ یعنی همه رکوردها)
+DEFAULT_SAMPLE_RATES = {"access": 1.0, "progress": 0.1, "heartbeat": 0.1}
+# حداکثر طول X-Request-ID دریافتی از کلاینت
+MAX_REQUEST_ID_LENGTH = 128
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+job_id_var: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("job_id", default=None)
+user_id_var: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("user_id", default=None)
+
+_CONTEXT_VARS = {"request_id": request_id_var, "job_id": job_id_var, "user_id": user_id_var}
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+def clean_request_id(value: Optional[str]) -> Optional[str]:
+    """اعتبارسنجی X-Request-ID کلاینت (فقط کاراکترهای قابل چاپ و طول محدود)."""
+    if not value or len(value) > MAX_REQUEST_ID_LENGTH or not value.isprintable():
+        return None
+    return value.strip() or None
+
+@contextmanager
+def bind(**fields):
+    """تنظیم موقت شناسه‌های request_id / job_id / user_id برای تمام لاگ‌های داخل بلوک."""
+    tokens = [(_CONTEXT_VARS[name], _CONTEXT_VARS[name].set(value)) for name, value in fields.items()]
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+def log_event(logger: logging.Logger, event: str, level: int = logging.INFO,
+              category: Optional[str] = None, exc_info=None, **fields) -> None:
+    """
+    ثبت یک رویداد ساختاریافته. event نام ثابت رویداد است (مثلاً job.finished)
+    و fields مقادیر دلخواه قابل جستجو (job_id و user_id در اینجا بر contextvars مقدم هستند).
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, event, exc_info=exc_info, extra={"fields": fields, "category": category})
+
+# ==========================================
+#          فرمت، فیلتر و صف (Handlers)
+# ==========================================
+
+class ContextFilter(logging.Filter):
+    """
+    کپی contextvars روی رکورد در ترد فراخواننده؛
+    چون رکورد در ترد QueueListener فرمت می‌شود و آنجا contextvars در دسترس نیستند.
+    """
+
+    def __init__(self, service: str):
+        super().__init__()
+        self.service = service
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.service = self.service
+        for name, var in _CONTEXT_VARS.items():
+            if not hasattr(record, name):
+                setattr(record, name, var.get())
+        return True
+
+class SamplingFilter(logging.Filter):
+    """
+    نمونه‌برداری قطعی (Deterministic) برای هر دسته: با نرخ r از هر round(1/r) رکورد یکی عبور می‌کند.
+    رکوردهای WARNING و بالاتر و رکوردهای بدون دسته همیشه عبور می‌کنند.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.every = {name: max(int(round(1 / rate)), 1) for name, rate in rates.items() if rate > 0}
+        self.muted = {name for name, rate in rates.items() if rate <= 0}
+        self._counters = {name: itertools.count() for name in self.every}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        category = getattr(record, "category", None)
+        if category is None or record.levelno >= logging.WARNING:
+            return True
+        if category in self.muted:
+            return False
+        every = self.every.get(category)
+        if every is None or every == 1:
+            return True
+        with self._lock:
+            return next(self._counters[category]) % every == 0
+
+def parse_sample_rates(spec: Optional[str]) -> Dict[str, float]:
+    """تبدیل "access=0.1,progress=0.05" به دیکشنری نرخ‌ها (روی نرخ‌های پیش‌فرض)."""
+    rates = dict(DEFAULT_SAMPLE_RATES)
+    for item in (spec or "").split(","):
+        name, sep, value = item.partition("=")
+        if sep and name.strip():
+            try:
+                rates[name.strip()] = float(value)
+            except ValueError:
+                continue
+    return rates
+
+class JsonFormatter(logging.Formatter):
+    """تبدیل رکورد به یک خط JSON."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "service": getattr(record, "service", None),
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        for name in _CONTEXT_VARS:
+            value = getattr(record, name, None)
+            if value is not None:
+                payload[name] = value
+        if getattr(record, "category", None):
+            payload["category"] = record.category
+        payload.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            payload["error"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload["error"] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler که در صورت پر بودن صف رکورد را دور می‌ریزد به جای انتظار یا خطا."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # فقط متن پیام و Traceback آماده می‌شوند؛ فرمت JSON در ترد Listener ساخته می‌شود.
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+_listener: Optional[QueueListener] = None
+_handler: Optional[NonBlockingQueueHandler] = None
+
+def setup_logging(service: str, stream=None, level: Optional[str] = None,
+                  sample_rates: Optional[Dict[str, float]] = None,
+                  queue_size: int = QUEUE_SIZE) -> QueueListener:
+    """
+    پیکربندی Logger پروژه (قابل فراخوانی چندباره؛ پیکربندی قبلی متوقف و جایگزین می‌شود).
+    service نام پروسه است (api یا worker) و در تمام رکوردها ثبت می‌شود.
+    """
+    global _listener, _handler
+    shutdown_logging()
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter())
+    log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    _handler = NonBlockingQueueHandler(log_queue)
+    _handler.addFilter(ContextFilter(service))
+    _handler.addFilter(SamplingFilter(
+        sample_rates if sample_rates is not None else parse_sample_rates(os.environ.get("GPU_LOG_SAMPLE"))
+    ))
+
+    logger = logging.getLogger(ROOT_LOGGER)
+    logger.handlers = [_handler]
+    logger.setLevel(level or LOG_LEVEL)
+    logger.propagate = False
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+def shutdown_logging() -> None:
+    """توقف Listener و نوشتن رکوردهای باقی‌مانده صف."""
+    global _listener, _handler
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    if _handler is not None:
+        logging.getLogger(ROOT_LOGGER).removeHandler(_handler)
+        _handler = None
+
+def dropped_records() -> int:
+    """تعداد رکوردهایی که به دلیل پر بودن صف دور ریخته شده‌اند."""
+    return _handler.dropped if _handler is not None else 0
+
+# رکوردهای داخل صف هنگام خروج پروسه نوشته می‌شوند.
+atexit.register(shutdown_logging)
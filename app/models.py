@@ -2,14 +2,23 @@
 مدل‌های داده (Database Models)
 -----------------------------
 تعریف ساختار جداول دیتابیس با استفاده از SQLAlchemy ORM.
-شامل جداول کاربران (User) و درخواست‌ها (Job).
+شامل جداول کاربران (User)، درخواست‌ها (Job)، پردازشگرها (Worker) و اجاره‌ها (JobLease).
 """
 
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime
+import uuid
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Float, Index, text
 from sqlalchemy.orm import relationship
 from .database import Base
 from datetime import datetime
 
+# وضعیت‌های تسک فعال (در صف یا در حال اجرا)
+ACTIVE_STATUSES = ("PENDING", "APPROVED", "PREEMPTED", "RUNNING")
+def new_storage_key() -> str:
+    """کلید تصادفی فایل‌های یک تسک (لاگ و Checkpoint)؛ برخلاف شناسه هرگز تکرار نمی‌شود."""
+    return f"job_{uuid.uuid4().hex}"
+
+_ACTIVE_WHERE = text("status IN (%s)" % ", ".join(f"'{status}'" for status in ACTIVE_STATUSES))
+
 class User(Base):
     """
     جدول کاربران (Users Table)
@@ -42,18 +51,79 @@ class Job(Base):
     gpu_type = Column(String)          # نوع کارت گرافیک (مثلاً T4, V100)
     gpu_count = Column(Integer)        # تعداد کارت درخواستی
     command = Column(String)           # دستور اجرایی کاربر (مثلاً python train.py)
+    # هش (owner, gpu_type, gpu_count, command) برای تشخیص درخواست‌های تکراری
+    content_hash = Column(String, index=True, nullable=True)    # فقط با GPU_DEDUPE_ACTIVE_JOBS=1 پر می‌شود
+    # نام فایل‌های لاگ و Checkpoint تسک (ردیف‌های قدیمی: job_<id>، همان نام‌گذاری قبلی)
+    storage_key = Column(String, unique=True, index=True, default=new_storage_key)
     estimated_duration = Column(Integer) # مدت تخمینی اجرا (ثانیه)
     
-    # وضعیت درخواست (PENDING, RUNNING, COMPLETED, FAILED)
+    # وضعیت درخواست (PENDING, APPROVED, RUNNING, PREEMPTED, COMPLETED, FAILED)
     status = Column(String, default="PENDING")
     
+    # اولویت اجرا (عدد بزرگ‌تر = اولویت بالاتر) و آمار پیش‌دستی (Preemption)
+    priority = Column(Integer, default=0)
+    preempt_count = Column(Integer, default=0)       # چند بار برای تسک مهم‌تر متوقف شده است
+    consumed_seconds = Column(Integer, default=0)    # مجموع زمان اجرای انجام شده (در تمام دفعات)
+    
     # زمان‌بندی‌ها
     created_at = Column(DateTime, default=datetime.now) # زمان ثبت
     started_at = Column(DateTime, nullable=True)        # زمان شروع اجرا
     completed_at = Column(DateTime, nullable=True)      # زمان پایان
+    # شناسه درخواست HTTP ثبت کننده (X-Request-ID) برای همبستگی لاگ‌های API و Worker
+    request_id = Column(String, nullable=True)
+    # شناسه درخواست مدیری که تسک را تایید کرده است (PUT /jobs/{id})
+    approved_request_id = Column(String, nullable=True)
+    # زمان آخرین تغییر وضعیت (برای همگام‌سازی افزایشی مدل پیش‌بینی صف)
+    status_changed_at = Column(DateTime, default=datetime.now, index=True)
+    
+    # تعداد دفعاتی که Worker اجرای این درخواست را شروع کرده است (برای محدود کردن تلاش مجدد)
+    attempts = Column(Integer, default=0)
+    
+    # پیشرفت اجرا (درصد) و زمان باقی‌مانده تخمینی؛ توسط Worker به صورت دسته‌ای به‌روز می‌شوند.
+    progress = Column(Float, default=0.0)
+    eta_seconds = Column(Integer, nullable=True)
     
     # کلید خارجی (Foreign Key) برای ارتباط با کاربر
     owner_id = Column(Integer, ForeignKey("users.id"))
     
     # ارتباط معکوس با User
-    owner = relationship("User", back_populates="jobs")
\ No newline at end of file
+    owner = relationship("User", back_populates="jobs")
+
+    __table_args__ = (
+        # ایندکس ترکیبی برای برداشتن سریع تسک بعدی از صف (بر اساس وضعیت و اولویت)
+        Index("ix_jobs_status_priority", "status", "priority", "id"),
+        # یکتایی هش محتوا در میان تسک‌های فعال هر کاربر (ایندکس جزئی؛ NULLها یکتا حساب نمی‌شوند)
+        Index("uq_jobs_active_content_hash", "owner_id", "content_hash", unique=True,
+              sqlite_where=_ACTIVE_WHERE, postgresql_where=_ACTIVE_WHERE),
+        # شناسه تسک‌های حذف شده در SQLite دوباره استفاده نمی‌شود (در PostgreSQL همیشه چنین است).
+        {"sqlite_autoincrement": True},
+    )
+
+class Worker(Base):
+    """
+    جدول پردازشگرها (Workers Table)
+    -------------------------------
+    هر پروسه worker.py هنگام شروع خود را ثبت می‌کند و به صورت دوره‌ای
+    ضربان قلب (Heartbeat) می‌فرستد.
+    """
+    __tablename__ = "workers"
+
+    id = Column(String, primary_key=True)                 # شناسه یکتا (hostname-pid-random)
+    hostname = Column(String)
+    pid = Column(Integer)
+    started_at = Column(DateTime, default=datetime.now)
+    last_heartbeat = Column(DateTime, default=datetime.now, index=True)
+
+class JobLease(Base):
+    """
+    جدول اجاره‌ها (Job Leases Table)
+    --------------------------------
+    هر درخواست در حال اجرا (RUNNING) دقیقاً یک اجاره دارد که Worker باید آن را تمدید کند.
+    این جدول فقط به اندازه تعداد تسک‌های در حال اجرا رکورد دارد و روی expires_at ایندکس شده است،
+    بنابراین Reaper هرگز کل جدول jobs را پیمایش نمی‌کند.
+    """
+    __tablename__ = "job_leases"
+
+    job_id = Column(Integer, ForeignKey("jobs.id"), primary_key=True)
+    worker_id = Column(String, ForeignKey("workers.id"), index=True)
+    expires_at = Column(DateTime, index=True)
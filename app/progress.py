@@ -0,0 +1,83 @@
+"""
+ماژول گزارش پیشرفت تسک‌ها (Progress Reporting)
+----------------------------------------------
+تسک‌های در حال اجرا درصد پیشرفت و زمان باقی‌مانده (ETA) را گزارش می‌دهند.
+گزارش‌ها در حافظه ادغام (Coalesce) می‌شوند: برای هر تسک فقط آخرین مقدار نگه داشته می‌شود
+و به صورت دوره‌ای همه با یک دستور UPDATE دسته‌ای (executemany) در دیتابیس نوشته می‌شوند.
+بنابراین هزاران تسک همزمان فقط یک commit در هر دوره ایجاد می‌کنند.
+"""
+
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from sqlalchemy import bindparam, update
+from sqlalchemy.orm import Session
+from . import models
+
+# فاصله نوشتن گزارش‌ها در دیتابیس (ثانیه)
+FLUSH_INTERVAL = 2.0
+
+@dataclass
+class ProgressUpdate:
+    job_id: int
+    percent: float
+    eta_seconds: Optional[int]
+
+class ProgressTracker:
+    """
+    بافر گزارش‌های پیشرفت (Thread-safe).
+    متد report در مسیر داغ (Hot Path) صدا زده می‌شود و هیچ I/O انجام نمی‌دهد.
+    """
+
+    def __init__(self):
+        self._pending: Dict[int, ProgressUpdate] = {}
+        self._lock = threading.Lock()
+
+    def report(self, job_id: int, percent: float, eta_seconds: Optional[int] = None) -> None:
+        """ثبت آخرین وضعیت پیشرفت یک تسک (مقدار قبلی flush نشده جایگزین می‌شود)."""
+        update_ = ProgressUpdate(
+            job_id=job_id,
+            percent=round(min(max(percent, 0.0), 100.0), 1),
+            eta_seconds=None if eta_seconds is None else max(int(eta_seconds), 0),
+        )
+        with self._lock:
+            self._pending[job_id] = update_
+
+    def discard(self, job_id: int) -> None:
+        """حذف گزارش flush نشده یک تسک (مثلاً وقتی تسک تمام شده است)."""
+        with self._lock:
+            self._pending.pop(job_id, None)
+
+    def drain(self) -> List[ProgressUpdate]:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return list(pending.values())
+
+    def flush(self, db: Session) -> int:
+        """
+        نوشتن تمام گزارش‌های ادغام شده با یک UPDATE دسته‌ای و یک commit.
+        فقط تسک‌هایی که هنوز RUNNING هستند به‌روز می‌شوند.
+        خروجی: تعداد گزارش‌های ارسال شده.
+        """
+        updates = self.drain()
+        if not updates:
+            return 0
+        table = models.Job.__table__
+        stmt = (
+            update(table)
+            .where(table.c.id == bindparam("_job_id"), table.c.status == "RUNNING")
+            .values(progress=bindparam("_percent"), eta_seconds=bindparam("_eta"))
+        )
+        try:
+            db.execute(stmt, [
+                {"_job_id": u.job_id, "_percent": u.percent, "_eta": u.eta_seconds} for u in updates
+            ])
+            db.commit()
+        except Exception:
+            db.rollback()
+            # گزارش‌ها به بافر برمی‌گردند مگر اینکه گزارش جدیدتری رسیده باشد.
+            with self._lock:
+                for u in updates:
+                    self._pending.setdefault(u.job_id, u)
+            raise
+        return len(updates)
@@ -58,6 +58,21 @@ class JobCreate(JobBase):
     """داده‌های ورودی کاربر برای ثبت درخواست"""
     pass
 
+class JobEta(BaseModel):
+    """
+    پیش‌بینی زمان شروع و پایان یک تسک در صف.
+    برای تسک‌های پایان یافته تمام فیلدهای پیش‌بینی خالی (null) هستند.
+    """
+    job_id: int
+    status: str
+    queue_position: Optional[int] = None           # 0 یعنی در حال اجرا
+    estimated_wait_seconds: Optional[int] = None
+    estimated_start_at: Optional[datetime] = None
+    estimated_completion_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
 class JobResponse(JobBase):
     """
     داده‌های کامل درخواست که شامل وضعیت و زمان‌بندی‌هاست
@@ -69,6 +84,13 @@ class JobResponse(JobBase):
     created_at: datetime
     started_at: Optional[datetime] = None
     completed_at: Optional[datetime] = None
+    progress: Optional[float] = 0.0
+    eta_seconds: Optional[int] = None
+    priority: Optional[int] = 0
+    preempt_count: Optional[int] = 0
+    consumed_seconds: Optional[int] = 0
+    # فقط در پاسخ ثبت درخواست پر می‌شود
+    queue_estimate: Optional[JobEta] = None
     
     class Config:
         from_attributes = True
\ No newline at end of file
@@ -11,10 +11,11 @@ from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from . import models, database
+from . import models, database, logging_setup
 
 # تنظیمات امنیتی JWT
 SECRET_KEY = "mysecretkey"  # در محیط واقعی باید از Environment Variable خوانده شود
@@ -69,14 +70,8 @@ def get_db():
     finally:
         db.close()
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> models.User:
-    """
-    تزریق وابستگی کاربر فعلی (Authentication Dependency).
-    1. توکن را از هدر می‌گیرد.
-    2. آن را رمزگشایی می‌کند.
-    3. کاربر مربوطه را از دیتابیس پیدا می‌کند.
-    اگر هر مشکلی باشد، خطای 401 برمی‌گرداند.
-    """
+def _authenticate(token: str, db: Session) -> models.User:
+    """رمزگشایی توکن و یافتن کاربر آن؛ در صورت هر مشکلی خطای 401."""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="اعتبارنامه معتبر نیست (Could not validate credentials)",
@@ -95,4 +90,22 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     user = db.query(models.User).filter(models.User.username == username).first()
     if user is None:
         raise credentials_exception
-    return user
\ No newline at end of file
+    return user
+
+async def get_current_user(request: Request, token: str = Depends(oauth2_scheme),
+                           db: Session = Depends(get_db)) -> models.User:
+    """
+    تزریق وابستگی کاربر فعلی (Authentication Dependency).
+    1. توکن را از هدر می‌گیرد.
+    2. آن را رمزگشایی می‌کند.
+    3. کاربر مربوطه را از دیتابیس پیدا می‌کند.
+    اگر هر مشکلی باشد، خطای 401 برمی‌گرداند.
+
+    شناسه کاربر برای لاگ‌ها (user_id) در Context همین درخواست تنظیم می‌شود. این وابستگی عمداً async
+    است: وابستگی sync در ترد جداگانه با کپی Context اجرا می‌شود و مقدار تنظیم شده به endpoint نمی‌رسد.
+    لاگ دسترسی Middleware شناسه را از request.state می‌خواند.
+    """
+    user = await run_in_threadpool(_authenticate, token, db)
+    logging_setup.user_id_var.set(user.id)
+    request.state.user_id = user.id
+    return user
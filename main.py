@@ -9,23 +9,36 @@
 4. مدیریت درخواست‌های پردازشی (Jobs & Quota Management).
 """
 
+import asyncio
 import os
+import re
+import time
+from datetime import datetime
 from typing import List, Generator, Optional
-from fastapi import FastAPI, Depends, HTTPException, status, Request
+from fastapi import FastAPI, Depends, HTTPException, status, Request, Header
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from fastapi.responses import HTMLResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.security import OAuth2PasswordRequestForm
-from app import models, schemas, database, security
+from app import models, schemas, database, security, leases, job_logs, idempotency, scheduler, eta, logging_setup
+from app.logging_setup import log_event
+from app.executors import CommandError, parse_command, remove_checkpoint
+from app.assets import StaticAssetStore, PageCache
 
 # ==========================================
 #              تنظیمات اولیه (Setup)
 # ==========================================
 
+# لاگ ساختاریافته (JSON) و غیرمسدودکننده
+logging_setup.setup_logging("api")
+logger = logging_setup.get_logger("api")
+
 # ایجاد جداول دیتابیس در صورتی که وجود نداشته باشند
 models.Base.metadata.create_all(bind=database.engine)
+database.upgrade_schema()
 
 app = FastAPI(
     title="GPU Service API",
@@ -38,10 +51,14 @@ base_dir = os.path.dirname(os.path.abspath(__file__))
 static_path = os.path.join(base_dir, "static")
 templates_path = os.path.join(base_dir, "templates")
 
-# اتصال پوشه static برای فایل‌های CSS و JS
-app.mount("/static", StaticFiles(directory=static_path), name="static")
+# پیش‌پردازش فایل‌های CSS و JS (هش محتوا + نسخه‌های gzip/brotli)
+assets = StaticAssetStore(static_path, url_prefix="/static")
 # تنظیم موتور قالب‌ساز Jinja2
 templates = Jinja2Templates(directory=templates_path)
+# تابع asset_url در قالب‌ها آدرس نسخه‌دار فایل‌ها را تولید می‌کند.
+templates.env.globals["asset_url"] = assets.url_for
+# کش خروجی رندر شده صفحات (هر قالب فقط یک بار رندر می‌شود)
+pages = PageCache(templates.env)
 
 # تنظیمات امنیتی CORS (برای اجازه دسترسی از دامنه‌های مختلف)
 # در محیط توسعه همه دامنه‌ها (*) مجاز هستند.
@@ -53,6 +70,30 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def request_context(request: Request, call_next):
+    """
+    همبستگی درخواست‌ها (Request Correlation).
+    شناسه X-Request-ID کلاینت (یا یک شناسه جدید) برای تمام لاگ‌های این درخواست تنظیم
+    و در هدر پاسخ برگردانده می‌شود. لاگ دسترسی در دسته access (قابل نمونه‌برداری) ثبت می‌شود.
+    """
+    request_id = logging_setup.clean_request_id(request.headers.get("x-request-id")) or logging_setup.new_request_id()
+    started = time.perf_counter()
+    with logging_setup.bind(request_id=request_id):
+        response = await call_next(request)
+        response.headers["X-Request-ID"] = request_id
+        # get_current_user شناسه کاربر احراز هویت شده را روی request.state قرار می‌دهد.
+        with logging_setup.bind(user_id=getattr(request.state, "user_id", None)):
+            log_event(logger, "http.request", category="access", method=request.method,
+                      path=request.url.path, status=response.status_code,
+                      duration_ms=round((time.perf_counter() - started) * 1000, 2))
+    return response
+
+# حافظه کلیدهای Idempotency برای POST /jobs/ (محدود و دارای TTL)
+idempotency_store = idempotency.IdempotencyStore()
+# مدل درون‌حافظه‌ای صف برای پیش‌بینی زمان شروع (به صورت افزایشی به‌روز می‌شود)
+queue_model = eta.QueueModel()
+
 def get_db() -> Generator[Session, None, None]:
     """
     تزریق وابستگی دیتابیس (Dependency Injection).
@@ -72,13 +113,25 @@ def get_db() -> Generator[Session, None, None]:
 
 @app.get("/", response_class=HTMLResponse)
 def login_page(request: Request):
-    """رندر کردن صفحه ورود و ثبت‌نام (Landing Page)."""
-    return templates.TemplateResponse("index.html", {"request": request})
+    """صفحه ورود و ثبت‌نام (Landing Page) از کش رندر شده."""
+    return pages.response(request, "index.html")
 
 @app.get("/dashboard", response_class=HTMLResponse)
 def dashboard_page(request: Request):
-    """رندر کردن صفحه داشبورد مدیریت درخواست‌ها."""
-    return templates.TemplateResponse("dashboard.html", {"request": request})
+    """صفحه داشبورد مدیریت درخواست‌ها از کش رندر شده."""
+    return pages.response(request, "dashboard.html")
+
+@app.api_route("/static/{path:path}", methods=["GET", "HEAD"], include_in_schema=False)
+def static_files(path: str, request: Request) -> Response:
+    """
+    سرو فایل‌های استاتیک از حافظه.
+    - نام نسخه‌دار (styles.<hash>.css): کش یک‌ساله و immutable.
+    - نام اصلی (styles.css): اعتبارسنجی با ETag و پاسخ 304.
+    """
+    response = assets.response(request, path)
+    if response is None:
+        raise HTTPException(status_code=404, detail="فایل یافت نشد.")
+    return response
 
 # ==========================================
 #              مدیریت کاربران (Authentication)
@@ -172,17 +225,77 @@ def charge_quota(
 def create_job(
     job: schemas.JobCreate, 
     db: Session = Depends(get_db), 
-    current_user: models.User = Depends(security.get_current_user)
-) -> models.Job:
+    current_user: models.User = Depends(security.get_current_user),
+    idempotency_key: Optional[str] = Header(None)
+) -> schemas.JobResponse:
     """
     ثبت درخواست پردازش جدید (Create Job).
+
+    پشتیبانی از هدر Idempotency-Key:
+    - تکرار درخواست با همان کلید و همان بدنه، پاسخ اول را بدون نوشتن در دیتابیس برمی‌گرداند
+      (با هدر Idempotent-Replayed: true).
+    - استفاده از همان کلید با بدنه متفاوت: خطای 422.
+    - اگر درخواست اول هنوز در حال اجرا باشد: خطای 409.
+
+    پاسخ شامل پیش‌بینی زمان شروع (queue_estimate) است. پاسخ ذخیره شده برای تکرار بدون این
+    پیش‌بینی نگه داشته می‌شود و پیش‌بینی در هر تکرار دوباره محاسبه می‌شود (صف تغییر کرده است).
+    """
+    if idempotency_key is None:
+        return _with_estimate(db, _submit_job(job, db, current_user))
+
+    if not idempotency_key.strip() or len(idempotency_key) > idempotency.MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail="هدر Idempotency-Key نامعتبر است.")
+
+    request_fingerprint = idempotency.fingerprint(job.dict())
+    state, entry = idempotency_store.begin(current_user.id, idempotency_key, request_fingerprint)
+    if state == idempotency.REPLAY:
+        content = dict(entry.body, queue_estimate=jsonable_encoder(_estimate_for(db, entry.body["id"])))
+        return JSONResponse(content=content, status_code=entry.status_code,
+                            headers={"Idempotent-Replayed": "true"})
+    if state == idempotency.CONFLICT:
+        raise HTTPException(status_code=422, detail="این Idempotency-Key قبلاً برای درخواست دیگری استفاده شده است.")
+    if state == idempotency.IN_FLIGHT:
+        raise HTTPException(status_code=409, detail="درخواست قبلی با همین Idempotency-Key هنوز در حال پردازش است.")
+
+    try:
+        new_job = _submit_job(job, db, current_user)
+    except Exception:
+        idempotency_store.abandon(current_user.id, idempotency_key)
+        raise
+    response = _with_estimate(db, new_job)
+    idempotency_store.complete(current_user.id, idempotency_key, 200,
+                               jsonable_encoder(response, exclude={"queue_estimate"}))
+    return response
+
+def _estimate_for(db: Session, job_id: int) -> Optional[schemas.JobEta]:
+    """پیش‌بینی فعلی زمان شروع یک تسک (None برای تسک غیرفعال)."""
+    queue_model.sync(db)
+    estimate = queue_model.estimate(job_id)
+    return schemas.JobEta.model_validate(estimate) if estimate is not None else None
+
+def _with_estimate(db: Session, job: models.Job) -> schemas.JobResponse:
+    """تبدیل تسک به پاسخ API به همراه پیش‌بینی زمان شروع."""
+    response = schemas.JobResponse.model_validate(job)
+    response.queue_estimate = _estimate_for(db, job.id)
+    return response
+
+def _submit_job(job: schemas.JobCreate, db: Session, current_user: models.User) -> models.Job:
+    """
+    منطق اصلی ثبت درخواست.
     
     مراحل اعتبارسنجی و منطق تجاری:
     1. بررسی ورودی‌ها (تعداد گرافیک معتبر باشد).
-    2. امنیت: جلوگیری از تزریق کد (Command Injection) با بررسی کاراکترهای خطرناک.
+    2. امنیت: جلوگیری از تزریق کد (Command Injection) با بررسی کاراکترهای خطرناک
+       و تجزیه دستور به argv (همان قوانینی که Worker هنگام اجرا اعمال می‌کند).
     3. محدودیت نرخ (Rate Limiting): کاربر نباید بیش از 2 درخواست فعال همزمان داشته باشد.
     4. بررسی سهمیه: اگر سهمیه کافی نباشد، درخواست رد می‌شود.
     5. کسر سهمیه و ثبت درخواست در صف.
+
+    اگر GPU_DEDUPE_ACTIVE_JOBS فعال باشد و کاربر یک تسک فعال با همان
+    (gpu_type, gpu_count, command) داشته باشد، همان تسک برگردانده می‌شود و سهمیه دوباره کسر نمی‌شود.
+    بررسی اولیه فقط مسیر سریع است؛ یکتایی را ایندکس جزئی uq_jobs_active_content_hash تضمین می‌کند:
+    اگر درخواست همزمانی زودتر ثبت شده باشد، INSERT با IntegrityError رد می‌شود، تراکنش (شامل کسر
+    سهمیه) برمی‌گردد و تسک ثبت شده برگردانده می‌شود.
     """
     
     # 1. اعتبارسنجی ورودی (Validation)
@@ -196,11 +309,23 @@ def create_job(
     dangerous_chars = [";", "&&", "|", "`", "$("]
     if any(char in job.command for char in dangerous_chars):
         raise HTTPException(status_code=400, detail="کاراکتر غیرمجاز در دستور (Security Alert).")
+    try:
+        parse_command(job.command)
+    except CommandError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # تشخیص درخواست تکراری بر اساس محتوا (Duplicate Detection)
+    content_hash = None
+    if idempotency.DEDUPE_ACTIVE_JOBS:
+        content_hash = idempotency.job_content_hash(current_user.id, job.gpu_type, job.gpu_count, job.command)
+        duplicate = _active_duplicate(db, current_user.id, content_hash)
+        if duplicate:
+            return duplicate
 
     # 3. محدودیت همزمانی (Rate Limiting)
     active_jobs = db.query(models.Job).filter(
         models.Job.owner_id == current_user.id,
-        models.Job.status.in_(["PENDING", "RUNNING"])
+        models.Job.status.in_(["PENDING", "RUNNING", "PREEMPTED"])
     ).count()
     
     if active_jobs >= 2:
@@ -217,16 +342,49 @@ def create_job(
         )
 
     # 5. کسر سهمیه و ذخیره (Deduct & Save)
-    db_user.quota -= job.estimated_duration
+    # کسر شرطی در خود دیتابیس (quota = quota - x WHERE quota >= x) تا درخواست‌های همزمان
+    # یک کاربر روی دیتابیس‌های چند-نویسنده (PostgreSQL) سهمیه را منفی نکنند.
+    charged = db.query(models.User).filter(
+        models.User.id == current_user.id,
+        models.User.quota >= job.estimated_duration
+    ).update({models.User.quota: models.User.quota - job.estimated_duration}, synchronize_session=False)
+    if charged != 1:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="سهمیه ناکافی! (درخواست همزمان دیگری سهمیه را مصرف کرد)")
     
-    new_job = models.Job(**job.dict(), owner_id=current_user.id)
+    # تسک‌های مدیر سیستم اولویت بالا دارند و می‌توانند تسک‌های عادی را متوقف کنند (Preemption).
+    new_job = models.Job(
+        **job.dict(),
+        owner_id=current_user.id,
+        content_hash=content_hash,
+        priority=scheduler.priority_for(current_user),
+        request_id=logging_setup.request_id_var.get()
+    )
     db.add(new_job)
     
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        duplicate = _active_duplicate(db, current_user.id, content_hash) if content_hash else None
+        if duplicate is None:
+            raise
+        log_event(logger, "job.duplicate_rejected", job_id=duplicate.id)
+        return duplicate
     db.refresh(new_job)
+    queue_model.apply(new_job)
+    log_event(logger, "job.created", job_id=new_job.id,
+              priority=new_job.priority, estimated_duration=new_job.estimated_duration)
     
     return new_job
 
+def _active_duplicate(db: Session, owner_id: int, content_hash: str) -> Optional[models.Job]:
+    return db.query(models.Job).filter(
+        models.Job.owner_id == owner_id,
+        models.Job.content_hash == content_hash,
+        models.Job.status.in_(models.ACTIVE_STATUSES)
+    ).first()
+
 @app.get("/jobs/", response_model=List[schemas.JobResponse])
 def read_jobs(
     db: Session = Depends(get_db), 
@@ -263,8 +421,15 @@ def update_job_status(
         raise HTTPException(status_code=404, detail="تسک مورد نظر یافت نشد.")
         
     job.status = status_update
+    job.status_changed_at = datetime.now()
+    if status_update == "APPROVED":
+        # شناسه درخواست تایید کننده هم ذخیره می‌شود تا لاگ‌های Worker به هر دو درخواست برسند.
+        job.approved_request_id = logging_setup.request_id_var.get()
     db.commit()
     db.refresh(job)
+    queue_model.apply(job)
+    log_event(logger, "job.status_changed", job_id=job.id, status=job.status,
+              submitted_request_id=job.request_id)
     return job
 
 @app.delete("/jobs/{job_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -279,6 +444,7 @@ def delete_job(
     - کاربر فقط می‌تواند درخواست‌های خودش را حذف کند (مگر اینکه ادمین باشد).
     - **مهم:** اگر وضعیت درخواست PENDING باشد (یعنی هنوز اجرا نشده)،
       سهمیه کسر شده به حساب کاربر **برمی‌گردد**.
+    - اگر درخواست PREEMPTED باشد (بخشی از آن اجرا شده)، فقط سهمیه مصرف نشده برمی‌گردد.
     """
     job = db.query(models.Job).filter(models.Job.id == job_id).first()
     if not job:
@@ -293,9 +459,145 @@ def delete_job(
     if job.status == "PENDING":
         owner = db.query(models.User).filter(models.User.id == job.owner_id).first()
         if owner:
-            owner.quota += job.estimated_duration
-            print(f"💰 بازگشت سهمیه: {job.estimated_duration} ثانیه به کاربر {owner.username} برگردانده شد.")
+            owner.quota = models.User.quota + job.estimated_duration
+            log_event(logger, "quota.refunded", job_id=job.id, user_id=owner.id,
+                      seconds=job.estimated_duration, reason="pending")
+    elif job.status == "PREEMPTED":
+        unused = max(job.estimated_duration - (job.consumed_seconds or 0), 0)
+        owner = db.query(models.User).filter(models.User.id == job.owner_id).first()
+        if owner and unused:
+            owner.quota = models.User.quota + unused
+            log_event(logger, "quota.refunded", job_id=job.id, user_id=owner.id,
+                      seconds=unused, reason="preempted")
 
+    # اگر تسک در حال اجرا بود، اجاره آن هم حذف می‌شود تا Worker نتیجه را بازنویسی نکند.
+    storage_key = job.storage_key
+    leases.release_job_lease(db, job.id)
     db.delete(job)
     db.commit()
-    return None
\ No newline at end of file
+    queue_model.remove(job_id)
+    # خروجی تسک ممکن است اطلاعات محرمانه داشته باشد؛ با حذف تسک پاک می‌شود.
+    job_logs.delete_log(storage_key)
+    remove_checkpoint(storage_key)
+    log_event(logger, "job.deleted", job_id=job_id)
+    return None
+
+@app.get("/jobs/{job_id}/eta", response_model=schemas.JobEta)
+def read_job_eta(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(security.get_current_user)
+) -> schemas.JobEta:
+    """
+    پیش‌بینی زمان انتظار و شروع یک تسک (Queue Wait-Time Estimation).
+
+    پاسخ از مدل درون‌حافظه‌ای صف (app/eta.py) محاسبه می‌شود و جدول jobs پیمایش نمی‌شود؛
+    فقط یک جستجو با کلید اصلی برای بررسی دسترسی و یک همگام‌سازی افزایشی (حداکثر هر ثانیه) انجام می‌شود.
+    """
+    job = db.query(models.Job).filter(models.Job.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="تسک یافت نشد.")
+    if not current_user.is_admin and job.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="شما اجازه مشاهده این تسک را ندارید.")
+
+    queue_model.sync(db)
+    estimate = queue_model.estimate(job_id)
+    if estimate is None:
+        # تسک پایان یافته یا هنوز در مدل نیست: پیش‌بینی وجود ندارد.
+        return schemas.JobEta(job_id=job.id, status=job.status)
+    return schemas.JobEta.model_validate(estimate)
+
+# حداکثر حجم یک پاسخ لاگ و تنظیمات حالت Follow
+LOG_READ_LIMIT = 256 * 1024
+LOG_FOLLOW_POLL_SECONDS = 0.5
+LOG_FOLLOW_MAX_SECONDS = 600
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+def _job_is_active(job_id: int) -> bool:
+    db = database.SessionLocal()
+    try:
+        job = db.query(models.Job.status).filter(models.Job.id == job_id).first()
+        return job is not None and job.status in ("PENDING", "APPROVED", "RUNNING", "PREEMPTED")
+    finally:
+        db.close()
+
+async def _follow_log(request: Request, job_id: int, log_key: str, offset: int):
+    """
+    ژنراتور حالت Follow (مشابه tail -f).
+    تا زمانی که تسک فعال است و کلاینت متصل است داده‌های جدید را ارسال می‌کند.
+    ژنراتور async است تا انتظار بین دورها هیچ تردی از Thread Pool را اشغال نکند؛
+    فقط خواندن فایل و بررسی وضعیت (هر کدام یک فراخوانی کوتاه) در Thread اجرا می‌شوند.
+    """
+    deadline = time.monotonic() + LOG_FOLLOW_MAX_SECONDS
+    last_status_check = 0.0
+    active = True
+    while time.monotonic() < deadline:
+        if await request.is_disconnected():
+            return
+        data, start, _ = await asyncio.to_thread(job_logs.read_log, log_key, offset, LOG_READ_LIMIT)
+        if data:
+            offset = start + len(data)
+            yield data
+            continue
+        if not active:
+            return
+        # وضعیت تسک هر ۲ ثانیه یک بار بررسی می‌شود، نه در هر دور حلقه.
+        if time.monotonic() - last_status_check >= 2:
+            active = await asyncio.to_thread(_job_is_active, job_id)
+            last_status_check = time.monotonic()
+        await asyncio.sleep(LOG_FOLLOW_POLL_SECONDS)
+
+@app.get("/jobs/{job_id}/logs")
+def read_job_logs(
+    job_id: int,
+    request: Request,
+    offset: int = 0,
+    limit: int = 64 * 1024,
+    follow: bool = False,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(security.get_current_user)
+):
+    """
+    دریافت خروجی (stdout/stderr) یک تسک.
+
+    - offset / limit: خواندن بازه‌ای از لاگ (آفست منطقی).
+    - هدر Range (مثلاً bytes=100-199 یا bytes=-500) هم پشتیبانی می‌شود و پاسخ 206 برمی‌گرداند.
+    - follow=true: اتصال باز می‌ماند و خروجی جدید تا پایان تسک ارسال می‌شود.
+    هدرهای X-Log-Start و X-Log-Size آفست شروع داده و انتهای فعلی لاگ را نشان می‌دهند.
+    """
+    job = db.query(models.Job).filter(models.Job.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="تسک یافت نشد.")
+    if not current_user.is_admin and job.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="شما اجازه مشاهده لاگ این تسک را ندارید.")
+
+    if follow:
+        return StreamingResponse(_follow_log(request, job_id, job.storage_key, max(offset, 0)), media_type="text/plain; charset=utf-8")
+
+    limit = min(max(limit, 0), LOG_READ_LIMIT)
+    status_code = 200
+    range_header = request.headers.get("range")
+    if range_header:
+        match = _RANGE_RE.match(range_header.strip())
+        if not match or match.groups() == ("", ""):
+            raise HTTPException(status_code=416, detail="هدر Range نامعتبر است.")
+        first, last = match.groups()
+        if first:
+            offset = int(first)
+            if last:
+                limit = min(int(last) - offset + 1, LOG_READ_LIMIT)
+        else:
+            # bytes=-N: آخرین N بایت
+            limit = min(int(last), LOG_READ_LIMIT)
+            offset = max(job_logs.log_size(job.storage_key) - limit, 0)
+        status_code = 206
+
+    data, start, end = job_logs.read_log(job.storage_key, max(offset, 0), limit)
+    headers = {"X-Log-Start": str(start), "X-Log-Size": str(end), "Accept-Ranges": "bytes"}
+    if status_code == 206:
+        if not data:
+            raise HTTPException(status_code=416, detail="بازه درخواستی خارج از لاگ است.",
+                                headers={"Content-Range": f"bytes */{end}"})
+        headers["Content-Range"] = f"bytes {start}-{start + len(data) - 1}/{end}"
+    return Response(content=data, status_code=status_code, headers=headers,
+                    media_type="text/plain; charset=utf-8")
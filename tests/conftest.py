@@ -3,7 +3,7 @@
 ----------------------------------------------------
 این فایل توسط Pytest به صورت خودکار اجرا می‌شود.
 وظیفه اصلی آن:
-1. ایجاد یک دیتابیس موقت و خالی (test_db.db) برای هر بار تست.
+1. ایجاد یک دیتابیس موقت و خالی برای هر بار تست (روی هر کدام از دیتابیس‌های TEST_DATABASE_URLS).
 2. جایگزینی دیتابیس اصلی برنامه با این دیتابیس تست (Dependency Override).
 3. فراهم کردن کلاینت تست (TestClient) برای ارسال درخواست‌ها.
 """
@@ -11,7 +11,6 @@
 import sys
 import os
 import pytest
-from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from fastapi.testclient import TestClient
 
@@ -19,23 +18,38 @@ from fastapi.testclient import TestClient
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # ایمپورت کردن برنامه اصلی و وابستگی‌ها
+import main
 from main import app, get_db
-from app.database import Base
+from app import database, leases
+from app.database import Base, make_engine
 from app.security import get_db as security_get_db
 
-# آدرس دیتابیس مخصوص تست (فایلی جدا از دیتابیس اصلی)
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test_db.db"
+# دیتابیس‌هایی که کل مجموعه تست روی هر کدام اجرا می‌شود:
+# - sqlite-file: فایلی جدا از دیتابیس اصلی (test_db.db)
+# - sqlite-memory: دیتابیس درون‌حافظه‌ای با StaticPool (اتصال مشترک؛ همچنان Dialect SQLite)
+# - postgresql: فقط اگر TEST_POSTGRES_URL تنظیم شده باشد (دیتابیس باید خالی و مخصوص تست باشد)؛
+#   سرویس postgres در docker-compose.yml همین دیتابیس را فراهم می‌کند (نیازمند psycopg2-binary).
+TEST_DATABASE_URLS = {
+    "sqlite-file": "sqlite:///./test_db.db",
+    "sqlite-memory": "sqlite://",
+}
+if os.environ.get("TEST_POSTGRES_URL"):
+    TEST_DATABASE_URLS["postgresql"] = os.environ["TEST_POSTGRES_URL"]
 
-# ایجاد موتور دیتابیس تست
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+@pytest.fixture(scope="session", params=list(TEST_DATABASE_URLS))
+def engine(request):
+    """موتور دیتابیس تست (تمام تست‌ها یک بار برای هر دیتابیس اجرا می‌شوند)."""
+    test_engine = make_engine(TEST_DATABASE_URLS[request.param])
+    yield test_engine
+    test_engine.dispose()
 
-# ایجاد نشست‌های دیتابیس تست
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+@pytest.fixture(scope="session")
+def session_factory(engine):
+    """ایجاد نشست‌های دیتابیس تست"""
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 @pytest.fixture(scope="module")
-def client():
+def client(engine, session_factory):
     """
     فیکسچر (Fixture) اصلی کلاینت تست.
     این تابع قبل از اجرای تست‌ها اجرا می‌شود و محیط را آماده می‌کند.
@@ -43,13 +57,16 @@ def client():
     """
     
     # الف) ساختن تمام جداول در دیتابیس تست (Create Tables)
+    # حافظه‌های درون پروسه (کلیدهای Idempotency و مدل صف) هم پاک می‌شوند چون شناسه‌ها دوباره از ۱ شروع می‌شوند.
     Base.metadata.create_all(bind=engine)
+    main.idempotency_store = main.idempotency.IdempotencyStore()
+    main.queue_model.reset()
 
     # ب) تابع جایگزین برای وابستگی دیتابیس (Override)
     # این تابع به جای وصل شدن به دیتابیس اصلی، به test_db وصل می‌شود.
     def override_get_db():
         try:
-            db = TestingSessionLocal()
+            db = session_factory()
             yield db
         finally:
             db.close()
@@ -65,4 +82,33 @@ def client():
 
     # ث) پاکسازی نهایی (Teardown)
     # بعد از تمام شدن تست‌ها، جداول را حذف می‌کنیم تا محیط تمیز بماند.
-    Base.metadata.drop_all(bind=engine)
\ No newline at end of file
+    Base.metadata.drop_all(bind=engine)
+
+@pytest.fixture(scope="module")
+def db_session(engine, session_factory):
+    """
+    فیکسچر نشست دیتابیس برای تست مستقیم ماژول‌های داخلی (بدون HTTP).
+    جداول قبل از تست‌های فایل ساخته و پس از آن حذف می‌شوند.
+    """
+    Base.metadata.create_all(bind=engine)
+    db = session_factory()
+    try:
+        yield db
+    finally:
+        db.close()
+        Base.metadata.drop_all(bind=engine)
+
+@pytest.fixture(params=["compare-and-set", "skip-locked"])
+def claim_path(request, monkeypatch):
+    """
+    اجرای تست‌های برداشتن تسک روی هر دو مسیر leases.claim_next_job.
+    Dialect SQLite عبارت FOR UPDATE را حذف می‌کند، پس مسیر SKIP LOCKED (مخصوص PostgreSQL)
+    هم روی دیتابیس‌های تست محلی اجرا می‌شود. در این حالت استفاده از مسیر دیگر خطاست.
+    """
+    if request.param == "skip-locked":
+        monkeypatch.setattr(database, "supports_skip_locked", lambda bind: True)
+
+        def unexpected(*args, **kwargs):
+            raise AssertionError("مسیر Compare-and-Set نباید اجرا شود")
+        monkeypatch.setattr(leases, "_claim_compare_and_set", unexpected)
+    return request.param
@@ -0,0 +1,103 @@
+"""
+تست‌های لایه دیتابیس (Storage Backend Tests)
+-------------------------------------------
+1. انتخاب خودکار تنظیمات موتور بر اساس Dialect (WAL برای فایل SQLite، StaticPool برای حافظه).
+2. مسیر SKIP LOCKED برای PostgreSQL و مسیر Compare-and-Set برای SQLite.
+3. برداشتن همزمان تسک‌ها توسط چند Worker بدون برداشت تکراری (روی هر دو مسیر).
+4. مهاجرت دیتابیس‌های قدیمی (اضافه کردن ستون‌ها و ایندکس‌های جدید).
+"""
+
+import threading
+import pytest
+from sqlalchemy import inspect
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app import database, leases, models
+
+def test_engine_settings_follow_dialect(tmp_path):
+    file_engine = database.make_engine(f"sqlite:///{tmp_path / 'wal.db'}")
+    with file_engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+    assert not database.supports_skip_locked(file_engine)
+    file_engine.dispose()
+
+    memory_engine = database.make_engine("sqlite://")
+    assert isinstance(memory_engine.pool, StaticPool)
+
+def test_postgres_claim_query_skips_locked_rows(db_session):
+    sql = str(leases.skip_locked_candidate(db_session).statement.compile(dialect=postgresql.dialect()))
+    assert "FOR UPDATE SKIP LOCKED" in sql
+    assert "ORDER BY jobs.priority DESC, jobs.id" in sql
+
+def test_concurrent_workers_never_claim_the_same_job(engine, session_factory, db_session, claim_path):
+    if isinstance(engine.pool, StaticPool):
+        pytest.skip("یک اتصال مشترک؛ اجرای چند ترده معنی ندارد")
+    for _ in range(20):
+        db_session.add(models.Job(gpu_type="T4", gpu_count=1, command="run",
+                                  estimated_duration=10, status="APPROVED", owner_id=1))
+    db_session.commit()
+
+    claimed, errors = [], []
+
+    def worker(worker_id):
+        db = session_factory()
+        try:
+            while True:
+                job = leases.claim_next_job(db, worker_id)
+                if job is None:
+                    return
+                claimed.append(job.id)
+        except Exception as e:  # pragma: no cover - فقط برای گزارش خطای ترد
+            errors.append(e)
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=worker, args=(f"w{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert len(claimed) == 20 and len(set(claimed)) == 20
+
+# جدول jobs در نسخه اولیه پروژه (قبل از اضافه شدن ستون‌های اجاره، پیشرفت، اولویت و ...)
+LEGACY_JOBS_DDL = """
+CREATE TABLE jobs (
+    id INTEGER PRIMARY KEY, gpu_type VARCHAR, gpu_count INTEGER, command VARCHAR,
+    estimated_duration INTEGER, status VARCHAR, created_at DATETIME,
+    started_at DATETIME, completed_at DATETIME, owner_id INTEGER
+)
+"""
+
+def test_upgrade_schema_migrates_legacy_database(tmp_path):
+    legacy = database.make_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with legacy.begin() as conn:
+        conn.exec_driver_sql(LEGACY_JOBS_DDL)
+        conn.exec_driver_sql(
+            "INSERT INTO jobs (gpu_type, gpu_count, command, estimated_duration, status, created_at, owner_id) "
+            "VALUES ('T4', 1, 'run', 30, 'APPROVED', '2024-01-01 10:00:00.000000', 1)"
+        )
+    models.Base.metadata.create_all(bind=legacy)
+
+    added = database.upgrade_schema(legacy)
+    assert "jobs.priority" in added and "jobs.attempts" in added
+    assert database.upgrade_schema(legacy) == []  # اجرای دوباره هیچ تغییری نمی‌دهد
+    with legacy.connect() as conn:
+        row = conn.exec_driver_sql("SELECT status_changed_at, created_at, attempts, storage_key FROM jobs").first()
+        indexes = {index["name"] for index in inspect(legacy).get_indexes("jobs")}
+    assert row[0] == row[1] and row[2] == 0
+    # لاگ‌های قبلی (job_<id>.log) با کلید ذخیره‌سازی ردیف‌های قدیمی پیدا می‌شوند.
+    assert row[3] == "job_1"
+    assert {"ix_jobs_status_priority", "ix_jobs_status_changed_at", "ix_jobs_content_hash",
+            "uq_jobs_active_content_hash"} <= indexes
+
+    db = sessionmaker(bind=legacy)()
+    try:
+        job = leases.claim_next_job(db, "w1")
+        assert job is not None and job.attempts == 1 and job.consumed_seconds == 0
+        assert job.priority == 0 and job.progress == 0.0
+    finally:
+        db.close()
+    legacy.dispose()
@@ -0,0 +1,119 @@
+"""
+تست‌های پیش‌بینی زمان شروع (Queue Wait-Time Estimation Tests)
+-------------------------------------------------------------
+1. شبیه‌سازی صف در حافظه: جایگاه، زمان انتظار و ترتیب اولویت.
+2. همگام‌سازی افزایشی با تغییرات Worker (فقط ردیف‌های تغییر کرده).
+3. اندپوینت GET /jobs/{id}/eta و پیش‌بینی در پاسخ ثبت درخواست.
+"""
+
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+import main
+from app import models, leases
+from app.eta import JobState, QueueModel
+
+NOW = datetime(2024, 1, 1, 12, 0, 0)
+
+def _state(job_id, status="APPROVED", duration=100, priority=0, started_ago=None):
+    started_at = NOW - timedelta(seconds=started_ago) if started_ago is not None else None
+    return JobState(id=job_id, status=status, priority=priority, estimated_duration=duration,
+                    consumed_seconds=0, started_at=started_at)
+
+def test_schedule_fills_slots_in_priority_order():
+    model = QueueModel(slots=2)
+    model.apply(_state(1, "RUNNING", duration=100, started_ago=20))   # ۸۰ ثانیه باقی‌مانده
+    model.apply(_state(2, "RUNNING", duration=100, started_ago=70))   # ۳۰ ثانیه باقی‌مانده
+    model.apply(_state(3, duration=60))
+    model.apply(_state(4, duration=60, priority=10))
+    model.apply(_state(5, "COMPLETED"))  # تسک غیرفعال وارد مدل نمی‌شود
+
+    assert len(model) == 4
+    running = model.estimate(1, now=NOW)
+    assert running.queue_position == 0 and running.estimated_wait_seconds == 0
+    assert running.estimated_completion_at == NOW + timedelta(seconds=80)
+
+    urgent, normal = model.estimate(4, now=NOW), model.estimate(3, now=NOW)
+    # تسک فوری روی اسلاتی که زودتر آزاد می‌شود (۳۰ ثانیه) و تسک عادی پس از آن (۸۰ ثانیه)
+    assert (urgent.queue_position, urgent.estimated_wait_seconds) == (1, 30)
+    assert (normal.queue_position, normal.estimated_wait_seconds) == (2, 80)
+    assert normal.estimated_start_at == NOW + timedelta(seconds=80)
+
+    model.remove(2)
+    assert model.estimate(4, now=NOW).estimated_wait_seconds == 0
+    assert model.estimate(2, now=NOW) is None
+
+def _job(db, status="APPROVED", duration=100) -> models.Job:
+    job = models.Job(gpu_type="T4", gpu_count=1, command="run", estimated_duration=duration,
+                     status=status, owner_id=1)
+    db.add(job)
+    db.commit()
+    return job
+
+def test_sync_picks_up_worker_changes_incrementally(db_session):
+    first, second = _job(db_session), _job(db_session)
+    _job(db_session, status="COMPLETED")
+    model = QueueModel(slots=1)
+    model.sync(db_session, force=True)
+    assert len(model) == 2
+    assert model.estimate(second.id).queue_position == 2
+
+    # تغییرات Worker از طریق ستون status_changed_at دیده می‌شوند.
+    leases.claim_next_job(db_session, "w1")
+    model.sync(db_session, force=True)
+    assert model.estimate(first.id).queue_position == 0
+    assert model.estimate(second.id).queue_position == 1
+    assert 95 <= model.estimate(second.id).estimated_wait_seconds <= 100
+
+    leases.finish_job(db_session, first.id, "w1")
+    model.sync(db_session, force=True)
+    assert model.estimate(first.id) is None
+    assert model.estimate(second.id).estimated_wait_seconds == 0
+
+def test_sync_rereads_changes_committed_after_a_later_stamp(db_session):
+    db_session.query(models.Job).delete()
+    db_session.commit()
+    t0 = datetime.now()
+    job_a, job_b = _job(db_session), _job(db_session)
+    model = QueueModel(slots=2)
+    model.sync(db_session, force=True)
+
+    # API یک تغییر با مهر t0+1 ثبت می‌کند و مدل همگام می‌شود.
+    job_b.status, job_b.status_changed_at = "FAILED", t0 + timedelta(seconds=1)
+    db_session.commit()
+    model.sync(db_session, force=True)
+    assert model.estimate(job_b.id) is None
+
+    # برداشتن تسک توسط Worker با مهر زودتر (t0) ولی commit دیرتر.
+    leases.claim_next_job(db_session, "w1", now=t0)
+    model.sync(db_session, force=True)
+    assert model.estimate(job_a.id).status == "RUNNING"
+
+def _login(client: TestClient, username: str) -> dict:
+    client.post("/register", json={"username": username, "password": "pw"})
+    token = client.post("/token", data={"username": username, "password": "pw"}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+def test_eta_endpoint_and_submit_response(client: TestClient, db_session):
+    # تسک‌های تست قبلی همین فایل پاک می‌شوند تا صف با وضعیت خالی شروع شود.
+    db_session.query(models.Job).delete()
+    db_session.commit()
+    main.queue_model.reset()
+    headers = _login(client, "eta_user")
+    job = {"gpu_type": "T4", "gpu_count": 1, "command": "python train.py", "estimated_duration": 40}
+
+    first = client.post("/jobs/", json=job, headers=headers).json()
+    second = client.post("/jobs/", json=job, headers=headers).json()
+    assert first["queue_estimate"]["queue_position"] == 1
+    assert second["queue_estimate"]["estimated_wait_seconds"] == 40
+
+    response = client.get(f"/jobs/{second['id']}/eta", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["queue_position"] == 2
+
+    stranger = _login(client, "eta_stranger")
+    assert client.get(f"/jobs/{second['id']}/eta", headers=stranger).status_code == 403
+    assert client.get("/jobs/999999/eta", headers=headers).status_code == 404
+
+    # پس از حذف تسک اول، تسک دوم اول صف است.
+    client.delete(f"/jobs/{first['id']}", headers=headers)
+    assert client.get(f"/jobs/{second['id']}/eta", headers=headers).json()["estimated_wait_seconds"] == 0
@@ -0,0 +1,247 @@
+"""
+تست‌های اجرای تسک‌ها و لاگ خروجی (Executors & Job Logs Tests)
+-------------------------------------------------------------
+1. تجزیه امن دستور به argv.
+2. اجرای واقعی دستور با SubprocessBackend (محدودیت‌ها پیش از exec، پوشه کاری جدا) و ذخیره خروجی در لاگ.
+3. چرخش لاگ با سقف حجم و آفست‌های منطقی پایدار.
+4. کانال گزارش پیشرفت برنامه (خط‌های GPU_PROGRESS در stdout).
+5. تشخیص Checkpoint ذخیره شده پس از Preemption.
+6. اندپوینت GET /jobs/{id}/logs (خواندن بازه‌ای، هدر Range و حالت Follow).
+"""
+
+import asyncio
+import os
+import sys
+import time
+import pytest
+from fastapi.testclient import TestClient
+from app import executors, job_logs, models
+from app.executors import (CommandError, JobSpec, SleepBackend, SubprocessBackend, parse_command,
+                           parse_progress_line)
+
+@pytest.fixture
+def log_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_logs, "LOG_DIR", str(tmp_path))
+    monkeypatch.setattr(executors, "SCRATCH_DIR", str(tmp_path / "scratch"))
+    return tmp_path
+
+def test_parse_command():
+    assert parse_command('python train.py --name "my run"') == ["python", "train.py", "--name", "my run"]
+    for bad in ["python a.py > out", "echo 'unclosed", "run\nrm -rf /", "", "echo ${HOME}"]:
+        with pytest.raises(CommandError):
+            parse_command(bad)
+
+def test_parse_command_allowlist(monkeypatch):
+    monkeypatch.setenv("GPU_ALLOWED_EXECUTABLES", "python,python3")
+    assert parse_command("/usr/bin/python3 x.py")[0] == "/usr/bin/python3"
+    with pytest.raises(CommandError):
+        parse_command("curl http://example.com")
+
+def _run(backend, spec, progress=None):
+    async def go():
+        log = await job_logs.JobLog(spec.storage_key).open()
+        try:
+            if progress is not None:
+                return await backend.run(spec, log, progress)
+            return await backend.run(spec, log)
+        finally:
+            await log.aclose()
+    return asyncio.run(go())
+
+def test_subprocess_backend_captures_output(log_dir):
+    command = f"{sys.executable} -c \"import sys; print('hello'); print('oops', file=sys.stderr); sys.exit(3)\""
+    exit_code = _run(SubprocessBackend(), JobSpec(id=1, command=command, estimated_duration=10))
+    assert exit_code == 3
+    data, start, end = job_logs.read_log("job_1")
+    assert b"hello" in data and b"oops" in data
+    assert start == 0 and end == len(data)
+
+def test_subprocess_backend_timeout(log_dir):
+    command = f"{sys.executable} -c \"import time; time.sleep(30)\""
+    exit_code = _run(SubprocessBackend(), JobSpec(id=2, command=command, estimated_duration=1))
+    assert exit_code != 0
+    assert b"timeout" in job_logs.read_log("job_2")[0]
+
+@pytest.mark.skipif(executors.resource is None, reason="ماژول resource فقط روی یونیکس")
+def test_subprocess_backend_applies_limits_before_exec(log_dir):
+    # محدودیت‌ها پیش از exec برقرارند؛ برنامه بلافاصله پس از شروع آن‌ها را می‌خواند.
+    script = ("import resource; "
+              "print(resource.getrlimit(resource.RLIMIT_NOFILE)[0], resource.getrlimit(resource.RLIMIT_AS)[0])")
+    exit_code = _run(SubprocessBackend(), JobSpec(id=5, command=f'{sys.executable} -c "{script}"',
+                                                  estimated_duration=10))
+    assert exit_code == 0
+    nofile, address_space = job_logs.read_log("job_5")[0].split()
+    assert int(nofile) == executors.OPEN_FILES_LIMIT
+    # سقف فضای آدرس به صورت پیش‌فرض غیرفعال است (CUDA فضای آدرس بزرگی رزرو می‌کند).
+    assert int(address_space) == executors.resource.RLIM_INFINITY
+
+def test_subprocess_backend_runs_in_per_job_scratch_dir(log_dir):
+    spec = JobSpec(id=8, command=f'{sys.executable} -c "import os; print(os.getcwd())"', estimated_duration=10)
+    assert _run(SubprocessBackend(), spec) == 0
+    workdir = job_logs.read_log(spec.storage_key)[0].decode().strip()
+    # پوشه کاری تسک، پوشه جاری Worker (کنار دیتابیس و لاگ‌ها) نیست و پس از اجرا پاک می‌شود.
+    assert workdir == executors.scratch_path(spec.storage_key) != os.getcwd()
+    assert not os.path.exists(workdir)
+
+def test_subprocess_backend_reports_missing_executable(log_dir):
+    spec = JobSpec(id=9, command="no-such-gpu-program --epochs 1", estimated_duration=10)
+    assert _run(SubprocessBackend(), spec) == 127
+    assert b"failed to start" in job_logs.read_log(spec.storage_key)[0]
+
+def test_sleep_backend_is_still_available(log_dir):
+    assert _run(SleepBackend(), JobSpec(id=3, command="train", estimated_duration=0)) == 0
+
+def test_parse_progress_line():
+    assert parse_progress_line(b"GPU_PROGRESS 42.5 120\r") == (42.5, 120)
+    assert parse_progress_line(b"  GPU_PROGRESS 7") == (7.0, None)
+    for bad in [b"GPU_PROGRESS", b"GPU_PROGRESS abc", b"GPU_PROGRESS 150", b"epoch 3 GPU_PROGRESS 5", b"GPU_PROGRESS 1 2 3"]:
+        assert parse_progress_line(bad) is None
+
+def test_subprocess_backend_reports_job_progress(log_dir):
+    # خط پیشرفت در دو تکه جدا چاپ می‌شود و بعد از آن برنامه بیش از یک ثانیه ادامه می‌دهد.
+    script = ("import sys, time; w = sys.stdout.write; "
+              "w('loss 0.1' + chr(10) + 'GPU_PRO'); sys.stdout.flush(); time.sleep(0.2); "
+              "w('GRESS 25 30' + chr(10)); sys.stdout.flush(); time.sleep(1.5); "
+              "w('GPU_PROGRESS 80' + chr(10))")
+    reports = []
+    exit_code = _run(SubprocessBackend(), JobSpec(id=6, command=f'{sys.executable} -c "{script}"',
+                                                  estimated_duration=1000),
+                     lambda percent, eta: reports.append((percent, eta)))
+    assert exit_code == 0
+    # بعد از اولین گزارش برنامه، تخمین زمانی دیگر ارسال نمی‌شود.
+    assert reports == [(25.0, 30), (80.0, None)]
+    assert b"GPU_PROGRESS 80" in job_logs.read_log("job_6")[0]
+
+def test_subprocess_backend_detects_fresh_checkpoint(tmp_path, monkeypatch):
+    monkeypatch.setattr(executors, "CHECKPOINT_DIR", str(tmp_path))
+    backend, spec = SubprocessBackend(), JobSpec(id=4, command="train", estimated_duration=10)
+    started = time.time() - 100
+    assert backend.checkpoint_time(spec, started) is None
+
+    path = executors.checkpoint_path(spec.storage_key)
+    os.makedirs(path)
+    state = os.path.join(path, "state.pt")
+    with open(state, "w") as handle:
+        handle.write("weights")
+    # زمان Checkpoint آخرین ذخیره است، نه لحظه توقف؛ فقط اجرا تا همین لحظه شارژ می‌شود.
+    for target in (path, state):
+        os.utime(target, (started + 30, started + 30))
+    assert backend.checkpoint_time(spec, started) == pytest.approx(started + 30)
+    # Checkpoint قدیمی‌تر از شروع اجرای فعلی (مثلاً از اجرای قبلی) حساب نمی‌شود.
+    assert backend.checkpoint_time(spec, started + 60) is None
+
+def test_log_rotation_keeps_logical_offsets(log_dir):
+    writer = job_logs.RotatingLogFile("job_7", max_bytes=10, backup_count=2)
+    payload = bytes(range(65, 65 + 26)) * 2  # 52 بایت
+    writer.write(payload)
+    writer.close()
+
+    # فقط ۳ فایل ۱۰ بایتی نگه داشته می‌شود؛ بقیه دور ریخته شده‌اند.
+    assert job_logs.log_size("job_7") == len(payload)
+    data, start, end = job_logs.read_log("job_7", offset=0)
+    assert end == len(payload)
+    assert data == payload[start:]
+    assert len(data) <= 30
+    # خواندن از یک آفست مشخص همان محتوای اصلی را برمی‌گرداند.
+    assert job_logs.read_log("job_7", offset=45, limit=5)[0] == payload[45:50]
+
+def _storage_key(db, job_id: int) -> str:
+    return db.query(models.Job.storage_key).filter(models.Job.id == job_id).scalar()
+
+def test_logs_endpoint(client: TestClient, db_session, log_dir):
+    client.post("/register", json={"username": "log_user", "password": "123"})
+    token = client.post("/token", data={"username": "log_user", "password": "123"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    job_id = client.post(
+        "/jobs/",
+        json={"gpu_type": "T4", "gpu_count": 1, "command": "python run.py", "estimated_duration": 5},
+        headers=headers,
+    ).json()["id"]
+
+    writer = job_logs.RotatingLogFile(_storage_key(db_session, job_id))
+    writer.write(b"line one\nline two\n")
+    writer.close()
+
+    full = client.get(f"/jobs/{job_id}/logs", headers=headers)
+    assert full.status_code == 200
+    assert full.content == b"line one\nline two\n"
+    assert full.headers["x-log-size"] == "18"
+
+    partial = client.get(f"/jobs/{job_id}/logs", headers={**headers, "Range": "bytes=5-7"})
+    assert partial.status_code == 206
+    assert partial.content == b"one"
+    assert partial.headers["content-range"] == "bytes 5-7/18"
+
+    tail = client.get(f"/jobs/{job_id}/logs", headers={**headers, "Range": "bytes=-9"})
+    assert tail.content == b"line two\n"
+
+    client.post("/register", json={"username": "log_other", "password": "123"})
+    other = client.post("/token", data={"username": "log_other", "password": "123"}).json()["access_token"]
+    assert client.get(f"/jobs/{job_id}/logs", headers={"Authorization": f"Bearer {other}"}).status_code == 403
+
+def test_deleted_job_output_never_reaches_next_job(client: TestClient, db_session, log_dir, tmp_path, monkeypatch):
+    monkeypatch.setattr(executors, "CHECKPOINT_DIR", str(tmp_path / "checkpoints"))
+    job = {"gpu_type": "T4", "gpu_count": 1, "command": "python run.py", "estimated_duration": 5}
+    owners = {}
+    for name in ("log_alice", "log_bob"):
+        client.post("/register", json={"username": name, "password": "123"})
+        token = client.post("/token", data={"username": name, "password": "123"}).json()["access_token"]
+        owners[name] = {"Authorization": f"Bearer {token}"}
+
+    alice_job = client.post("/jobs/", json=job, headers=owners["log_alice"]).json()["id"]
+    alice_key = _storage_key(db_session, alice_job)
+    writer = job_logs.RotatingLogFile(alice_key)
+    writer.write(b"alice secret token=XYZ\n")
+    writer.close()
+    checkpoint = executors.checkpoint_path(alice_key)
+    os.makedirs(checkpoint)
+    with open(os.path.join(checkpoint, "state.pt"), "w") as handle:
+        handle.write("alice weights")
+    assert client.delete(f"/jobs/{alice_job}", headers=owners["log_alice"]).status_code == 204
+    assert not any(name.startswith(alice_key) for name in os.listdir(log_dir))
+    assert not os.path.exists(checkpoint)
+
+    # شناسه تسک حذف شده دوباره استفاده نمی‌شود و کلید فایل‌ها هم جدید است.
+    bob_job = client.post("/jobs/", json=job, headers=owners["log_bob"]).json()["id"]
+    assert bob_job > alice_job and _storage_key(db_session, bob_job) != alice_key
+    response = client.get(f"/jobs/{bob_job}/logs", headers=owners["log_bob"])
+    assert response.status_code == 200 and response.content == b""
+
+class _FakeRequest:
+    """درخواستی که پس از چند بار بررسی، قطع اتصال کلاینت را گزارش می‌دهد."""
+
+    def __init__(self, connected_checks: int):
+        self.remaining = connected_checks
+
+    async def is_disconnected(self) -> bool:
+        self.remaining -= 1
+        return self.remaining < 0
+
+def test_follow_log_stops_on_disconnect_and_finished_job(log_dir, monkeypatch):
+    import main
+
+    async def collect(request, job_id):
+        return [chunk async for chunk in main._follow_log(request, job_id, f"job_{job_id}", 0)]
+
+    monkeypatch.setattr(main, "LOG_FOLLOW_POLL_SECONDS", 0.01)
+    writer = job_logs.RotatingLogFile("job_11")
+    writer.write(b"hello\n")
+    writer.close()
+
+    # تسک فعال است ولی کلاینت قطع شده: ژنراتور بدون انتظار ۶۰۰ ثانیه‌ای تمام می‌شود.
+    monkeypatch.setattr(main, "_job_is_active", lambda job_id: True)
+    assert asyncio.run(asyncio.wait_for(collect(_FakeRequest(connected_checks=5), 11), 2)) == [b"hello\n"]
+
+    # تسک تمام شده: باقی‌مانده لاگ ارسال و اتصال بسته می‌شود.
+    monkeypatch.setattr(main, "_job_is_active", lambda job_id: False)
+    assert asyncio.run(asyncio.wait_for(collect(_FakeRequest(connected_checks=100), 11), 5)) == [b"hello\n"]
+
+def test_create_job_rejects_unparsable_command(client: TestClient):
+    client.post("/register", json={"username": "quote_user", "password": "123"})
+    token = client.post("/token", data={"username": "quote_user", "password": "123"}).json()["access_token"]
+    response = client.post(
+        "/jobs/",
+        json={"gpu_type": "T4", "gpu_count": 1, "command": "python 'broken", "estimated_duration": 5},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 400
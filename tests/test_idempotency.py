@@ -0,0 +1,97 @@
+"""
+تست‌های جلوگیری از ثبت تکراری (Idempotency Tests)
+------------------------------------------------
+1. تکرار درخواست با همان Idempotency-Key پاسخ اول را برمی‌گرداند و سهمیه دوباره کسر نمی‌شود.
+2. استفاده از همان کلید با بدنه متفاوت رد می‌شود.
+3. تشخیص تسک تکراری بر اساس محتوا (در صورت فعال بودن)، حتی در رقابت دو درخواست همزمان.
+4. محدودیت حجم و انقضای حافظه کلیدها.
+"""
+
+from fastapi.testclient import TestClient
+import main
+from app import idempotency
+
+JOB = {"gpu_type": "T4", "gpu_count": 1, "command": "python train.py", "estimated_duration": 20}
+
+def _login(client: TestClient, username: str) -> dict:
+    client.post("/register", json={"username": username, "password": "123"})
+    token = client.post("/token", data={"username": username, "password": "123"}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+def test_replay_returns_original_response(client: TestClient):
+    headers = {**_login(client, "idem_user"), "Idempotency-Key": "form-1"}
+
+    first = client.post("/jobs/", json=JOB, headers=headers)
+    second = client.post("/jobs/", json=JOB, headers=headers)
+    assert first.status_code == second.status_code == 200
+    replayed, original = second.json(), first.json()
+    # پیش‌بینی صف ذخیره نمی‌شود و در هر تکرار از وضعیت فعلی صف محاسبه می‌شود.
+    assert replayed.pop("queue_estimate")["job_id"] == original.pop("queue_estimate")["job_id"]
+    assert replayed == original
+    assert second.headers["idempotent-replayed"] == "true"
+
+    # فقط یک بار سهمیه کسر شده است.
+    assert client.get("/users/me", headers=headers).json()["quota"] == 100
+    assert len(client.get("/jobs/", headers=headers).json()) == 1
+
+def test_key_reuse_with_different_body(client: TestClient):
+    headers = {**_login(client, "idem_conflict"), "Idempotency-Key": "form-2"}
+    assert client.post("/jobs/", json=JOB, headers=headers).status_code == 200
+    response = client.post("/jobs/", json={**JOB, "gpu_count": 2}, headers=headers)
+    assert response.status_code == 422
+
+def test_failed_request_releases_key(client: TestClient):
+    headers = {**_login(client, "idem_retry"), "Idempotency-Key": "form-3"}
+    too_long = {**JOB, "estimated_duration": 500}
+    assert client.post("/jobs/", json=too_long, headers=headers).status_code == 400
+    # کلید آزاد شده و با بدنه اصلاح شده قابل استفاده است.
+    assert client.post("/jobs/", json=JOB, headers=headers).status_code == 200
+
+def test_content_dedupe_among_active_jobs(client: TestClient, monkeypatch):
+    monkeypatch.setattr(idempotency, "DEDUPE_ACTIVE_JOBS", True)
+    headers = _login(client, "idem_dedupe")
+
+    first = client.post("/jobs/", json=JOB, headers=headers).json()
+    # estimated_duration جزو اثر انگشت نیست؛ دکمه دوبار کلیک شده همان تسک را برمی‌گرداند.
+    second = client.post("/jobs/", json={**JOB, "estimated_duration": 30}, headers=headers).json()
+    assert second["id"] == first["id"]
+    assert client.get("/users/me", headers=headers).json()["quota"] == 100
+
+    other = client.post("/jobs/", json={**JOB, "command": "python eval.py"}, headers=headers).json()
+    assert other["id"] != first["id"]
+
+def test_content_dedupe_race_is_caught_by_unique_index(client: TestClient, monkeypatch):
+    monkeypatch.setattr(idempotency, "DEDUPE_ACTIVE_JOBS", True)
+    headers = _login(client, "idem_race")
+    first = client.post("/jobs/", json=JOB, headers=headers).json()
+
+    # درخواست دوم بررسی اولیه را قبل از commit درخواست اول انجام داده است.
+    real_lookup, calls = main._active_duplicate, []
+
+    def lookup_before_first_commit(*args):
+        calls.append(args)
+        return None if len(calls) == 1 else real_lookup(*args)
+    monkeypatch.setattr(main, "_active_duplicate", lookup_before_first_commit)
+
+    second = client.post("/jobs/", json=JOB, headers=headers)
+    assert second.status_code == 200 and second.json()["id"] == first["id"]
+    assert len(calls) == 2
+    # INSERT رد شده و کسر سهمیه هم همراه آن برگشته است.
+    assert client.get("/users/me", headers=headers).json()["quota"] == 100
+    assert len(client.get("/jobs/", headers=headers).json()) == 1
+
+def test_store_is_bounded_and_expires():
+    store = idempotency.IdempotencyStore(max_entries=2, ttl_seconds=10)
+    for i in range(3):
+        assert store.begin(1, f"k{i}", "fp", now=0)[0] == idempotency.NEW
+        store.complete(1, f"k{i}", 200, {"id": i})
+    assert len(store) == 2
+    # قدیمی‌ترین کلید به دلیل سقف حجم حذف شده است.
+    assert store.begin(1, "k0", "fp", now=1)[0] == idempotency.NEW
+
+    state, entry = store.begin(1, "k2", "fp", now=5)
+    assert state == idempotency.REPLAY and entry.body == {"id": 2}
+    assert store.begin(1, "k2", "fp", now=11)[0] == idempotency.NEW
+    # کلید کاربران مختلف از هم جداست و درخواست در حال اجرا قابل تشخیص است.
+    assert store.begin(2, "k2", "fp", now=11)[0] == idempotency.NEW
+    assert store.begin(2, "k2", "fp", now=11)[0] == idempotency.IN_FLIGHT
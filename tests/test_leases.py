@@ -0,0 +1,79 @@
+"""
+تست‌های اجاره و بازیابی تسک‌ها (Worker Leases Tests)
+----------------------------------------------------
+1. برداشتن اتمیک تسک و ساخت اجاره.
+2. تمدید اجاره با Heartbeat.
+3. بازگشت تسک یتیم به صف و FAILED شدن پس از چند تلاش.
+"""
+
+from datetime import datetime, timedelta
+from app import models, leases
+
+def _approved_job(db, owner_id=1) -> models.Job:
+    job = models.Job(gpu_type="T4", gpu_count=1, command="run", estimated_duration=10,
+                     status="APPROVED", owner_id=owner_id)
+    db.add(job)
+    db.commit()
+    return job
+
+def test_claim_creates_lease(db_session, claim_path):
+    leases.register_worker(db_session, "w1", "host", 1)
+    job = _approved_job(db_session)
+
+    claimed = leases.claim_next_job(db_session, "w1")
+    assert claimed.id == job.id
+    assert claimed.status == "RUNNING"
+    assert claimed.attempts == 1
+    lease = db_session.query(models.JobLease).filter(models.JobLease.job_id == job.id).one()
+    assert lease.worker_id == "w1"
+
+    # تسک در حال اجرا دوباره برداشته نمی‌شود.
+    assert leases.claim_next_job(db_session, "w2") is None
+
+    assert leases.finish_job(db_session, job.id, "w1")
+    db_session.refresh(claimed)
+    assert claimed.status == "COMPLETED"
+    assert db_session.query(models.JobLease).count() == 0
+
+def test_heartbeat_renews_leases(db_session, claim_path):
+    job = _approved_job(db_session)
+    start = datetime.now()
+    leases.claim_next_job(db_session, "w1", now=start)
+
+    later = start + timedelta(seconds=leases.LEASE_TTL - 1)
+    assert leases.heartbeat(db_session, "w1", now=later) == {job.id}
+    # اجاره تمدید شده پس از TTL اولیه هنوز معتبر است.
+    assert leases.reap_expired_leases(db_session, now=start + timedelta(seconds=leases.LEASE_TTL + 1)) == []
+    leases.finish_job(db_session, job.id, "w1")
+
+def test_heartbeat_skips_leases_no_slot_is_running(db_session, claim_path):
+    job = _approved_job(db_session)
+    start = datetime.now()
+    leases.claim_next_job(db_session, "w1", now=start)
+
+    # اسلات تسک از کار افتاده است؛ Worker زنده فقط تسک‌های در حال اجرا را تمدید می‌کند.
+    later = start + timedelta(seconds=leases.LEASE_TTL - 1)
+    assert leases.heartbeat(db_session, "w1", set(), now=later) == set()
+    expired = start + timedelta(seconds=leases.LEASE_TTL + 1)
+    assert leases.reap_expired_leases(db_session, now=expired) == [(job.id, "APPROVED")]
+    leases.claim_next_job(db_session, "w1", now=expired)
+    leases.finish_job(db_session, job.id, "w1")
+
+def test_reaper_requeues_then_fails(db_session, claim_path):
+    job = _approved_job(db_session)
+    now = datetime.now()
+
+    for attempt in range(1, leases.MAX_ATTEMPTS + 1):
+        claimed = leases.claim_next_job(db_session, "dead-worker", now=now)
+        assert claimed.id == job.id and claimed.attempts == attempt
+        now += timedelta(seconds=leases.LEASE_TTL + 1)
+        expected = "APPROVED" if attempt < leases.MAX_ATTEMPTS else "FAILED"
+        assert leases.reap_expired_leases(db_session, now=now) == [(job.id, expected)]
+
+        # Worker کند در Heartbeat بعدی می‌فهمد که اجاره را از دست داده است.
+        assert job.id not in leases.heartbeat(db_session, "dead-worker", now=now)
+
+    # Worker مرده نمی‌تواند بعداً نتیجه را ثبت کند.
+    assert not leases.finish_job(db_session, job.id, "dead-worker")
+    db_session.refresh(job)
+    assert job.status == "FAILED"
@@ -0,0 +1,111 @@
+"""
+تست‌های لاگ ساختاریافته (Structured Logging Tests)
+-------------------------------------------------
+1. رکوردهای JSON با شناسه‌های request_id / job_id / user_id.
+2. نمونه‌برداری هر دسته و عبور همیشگی هشدارها.
+3. صف غیرمسدودکننده (دور ریختن رکورد به جای انتظار).
+4. همبستگی: X-Request-ID درخواست ثبت تسک روی تسک ذخیره می‌شود.
+5. user_id کاربر احراز هویت شده در لاگ‌های endpoint و لاگ دسترسی، و ذخیره شناسه درخواست تایید کننده.
+"""
+
+import io
+import json
+import logging
+import queue
+from fastapi.testclient import TestClient
+from app import logging_setup, models
+from app.logging_setup import log_event
+
+def _records(stream: io.StringIO) -> list:
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+def test_json_records_carry_context():
+    stream = io.StringIO()
+    logging_setup.setup_logging("test", stream=stream)
+    logger = logging_setup.get_logger("test")
+    try:
+        with logging_setup.bind(request_id="req-1", job_id=7):
+            log_event(logger, "job.finished", status="COMPLETED", user_id=3)
+            try:
+                raise RuntimeError("boom")
+            except RuntimeError:
+                log_event(logger, "worker.error", logging.ERROR, exc_info=True)
+        log_event(logger, "outside")
+    finally:
+        logging_setup.shutdown_logging()
+
+    finished, error, outside = _records(stream)
+    assert finished["event"] == "job.finished" and finished["service"] == "test"
+    assert (finished["request_id"], finished["job_id"], finished["user_id"]) == ("req-1", 7, 3)
+    assert finished["status"] == "COMPLETED"
+    assert "RuntimeError: boom" in error["error"] and error["level"] == "ERROR"
+    assert "request_id" not in outside
+
+def test_sampling_per_category():
+    stream = io.StringIO()
+    logging_setup.setup_logging("test", stream=stream, sample_rates={"progress": 0.1, "noise": 0})
+    logger = logging_setup.get_logger("test")
+    try:
+        for i in range(50):
+            log_event(logger, "progress.flushed", category="progress", rows=i)
+            log_event(logger, "noise", category="noise")
+        log_event(logger, "noise", logging.WARNING, category="noise")
+        log_event(logger, "job.created")
+    finally:
+        logging_setup.shutdown_logging()
+
+    events = [record["event"] for record in _records(stream)]
+    assert events.count("progress.flushed") == 5
+    assert events.count("noise") == 1 and events.count("job.created") == 1
+    assert logging_setup.parse_sample_rates("access=0.5,bad,x=y")["access"] == 0.5
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = logging_setup.NonBlockingQueueHandler(queue.Queue(maxsize=1))
+    record = logging.makeLogRecord({"msg": "event"})
+    handler.emit(record)
+    handler.emit(record)
+    assert handler.dropped == 1
+
+def test_request_id_is_echoed_and_stored_on_job(client: TestClient, db_session):
+    client.post("/register", json={"username": "log_user", "password": "pw"})
+    token = client.post("/token", data={"username": "log_user", "password": "pw"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}", "X-Request-ID": "trace-abc"}
+
+    response = client.post("/jobs/", json={"gpu_type": "T4", "gpu_count": 1, "command": "python a.py",
+                                           "estimated_duration": 10}, headers=headers)
+    assert response.headers["x-request-id"] == "trace-abc"
+    job = db_session.query(models.Job).filter(models.Job.id == response.json()["id"]).first()
+    assert job.request_id == "trace-abc"
+
+    generated = client.get("/users/me", headers={"Authorization": headers["Authorization"]})
+    assert len(generated.headers["x-request-id"]) == 32
+
+def test_user_id_and_approval_request_are_correlated(client: TestClient, db_session):
+    client.post("/register", json={"username": "admin", "password": "pw"})
+    admin_token = client.post("/token", data={"username": "admin", "password": "pw"}).json()["access_token"]
+    client.post("/register", json={"username": "log_owner", "password": "pw"})
+    token = client.post("/token", data={"username": "log_owner", "password": "pw"}).json()["access_token"]
+    owner = db_session.query(models.User).filter(models.User.username == "log_owner").first()
+
+    stream = io.StringIO()
+    logging_setup.setup_logging("api", stream=stream, sample_rates={})
+    try:
+        job_id = client.post("/jobs/", json={"gpu_type": "T4", "gpu_count": 1, "command": "python a.py",
+                                             "estimated_duration": 10},
+                             headers={"Authorization": f"Bearer {token}", "X-Request-ID": "submit-1"}).json()["id"]
+        approved = client.put(f"/jobs/{job_id}?status_update=APPROVED",
+                              headers={"Authorization": f"Bearer {admin_token}", "X-Request-ID": "approve-1"})
+        assert approved.status_code == 200
+    finally:
+        logging_setup.shutdown_logging()
+
+    records = {(record["event"], record.get("request_id")): record for record in _records(stream)}
+    # user_id از وابستگی احراز هویت به لاگ‌های endpoint و لاگ دسترسی Middleware می‌رسد.
+    assert records[("job.created", "submit-1")]["user_id"] == owner.id
+    assert records[("http.request", "submit-1")]["user_id"] == owner.id
+    changed = records[("job.status_changed", "approve-1")]
+    assert changed["submitted_request_id"] == "submit-1" and changed["user_id"] != owner.id
+
+    job = db_session.query(models.Job).filter(models.Job.id == job_id).first()
+    db_session.refresh(job)
+    assert (job.request_id, job.approved_request_id) == ("submit-1", "approve-1")
@@ -0,0 +1,48 @@
+"""
+تست‌های گزارش پیشرفت (Progress Reporting Tests)
+----------------------------------------------
+1. ادغام گزارش‌ها در حافظه (فقط آخرین مقدار هر تسک نوشته می‌شود).
+2. نوشتن دسته‌ای فقط برای تسک‌های RUNNING.
+3. محدود کردن مقادیر و حذف گزارش تسک تمام شده.
+"""
+
+from app import models
+from app.progress import ProgressTracker
+
+def _job(db, status) -> models.Job:
+    job = models.Job(gpu_type="T4", gpu_count=1, command="run", estimated_duration=100,
+                     status=status, owner_id=1)
+    db.add(job)
+    db.commit()
+    return job
+
+def test_reports_are_coalesced_and_flushed_in_batch(db_session):
+    running = [_job(db_session, "RUNNING") for _ in range(3)]
+    finished = _job(db_session, "COMPLETED")
+    tracker = ProgressTracker()
+
+    for step in range(1, 51):
+        for job in running:
+            tracker.report(job.id, step, 100 - step)
+    tracker.report(finished.id, 10, 90)
+
+    # ۱۵۰ گزارش برای ۳ تسک + ۱ گزارش برای تسک تمام شده -> فقط ۴ ردیف در یک دسته
+    assert tracker.flush(db_session) == 4
+    assert tracker.flush(db_session) == 0
+
+    for job in running:
+        db_session.refresh(job)
+        assert job.progress == 50.0
+        assert job.eta_seconds == 50
+    db_session.refresh(finished)
+    assert finished.progress == 0.0  # تسک غیر RUNNING دست نمی‌خورد
+
+def test_reports_are_clamped_and_discarded():
+    tracker = ProgressTracker()
+    tracker.report(1, 150, -5)
+    tracker.report(2, 20, 5)
+    tracker.discard(2)
+
+    [update_] = tracker.drain()
+    assert (update_.job_id, update_.percent, update_.eta_seconds) == (1, 100.0, 0)
+    assert tracker.drain() == []
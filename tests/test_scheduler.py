@@ -0,0 +1,179 @@
+"""
+تست‌های زمان‌بندی و پیش‌دستی (Scheduling & Preemption Tests)
+------------------------------------------------------------
+1. شبیه‌سازی گسسته یک خوشه اشباع شده و اندازه‌گیری زمان انتظار تسک‌های با اولویت بالا،
+   با و بدون Preemption.
+2. رعایت محدودیت‌های سیاست (حداکثر تعداد توقف، حداقل زمان اجرا).
+3. برداشتن تسک بر اساس اولویت، توقف و ادامه تسک، رزرو یک‌باره تسک منتظر و بازگشت سهمیه مصرف نشده.
+"""
+
+from dataclasses import dataclass
+from typing import List, Optional
+from app import models, leases, scheduler
+from app.scheduler import PreemptionPolicy, RunningJob, pick_victim
+
+# ==========================================
+#          شبیه‌ساز گسسته (Discrete Simulator)
+# ==========================================
+
+@dataclass
+class SimJob:
+    id: int
+    priority: int
+    duration: int
+    arrival: int
+    consumed: int = 0
+    preempt_count: int = 0
+    first_start: Optional[int] = None
+    finished: Optional[int] = None
+
+def simulate(jobs: List[SimJob], slots: int, preemption: bool,
+             policy: PreemptionPolicy = scheduler.DEFAULT_POLICY,
+             check_interval: int = 5, horizon: int = 50_000) -> List[SimJob]:
+    """
+    شبیه‌سازی ثانیه به ثانیه رفتار Workerها: برداشتن تسک به ترتیب (اولویت، شناسه)،
+    و در صورت پر بودن اسلات‌ها، حداکثر یک Preemption در هر check_interval.
+    """
+    running = {}  # slot -> (job, run_start)
+    for t in range(horizon):
+        for slot, (job, start) in list(running.items()):
+            if job.consumed + (t - start) >= job.duration:
+                job.consumed, job.finished = job.duration, t
+                del running[slot]
+
+        active = {job.id for job, _ in running.values()}
+        waiting = sorted(
+            (j for j in jobs if j.arrival <= t and j.finished is None and j.id not in active),
+            key=lambda j: (-j.priority, j.id),
+        )
+
+        if preemption and waiting and len(running) == slots and t % check_interval == 0:
+            victim = pick_victim(
+                [RunningJob(job.id, job.priority, start, job.preempt_count) for job, start in running.values()],
+                waiting[0].priority, t, policy,
+            )
+            if victim is not None:
+                slot = next(s for s, (job, _) in running.items() if job.id == victim.job_id)
+                job, start = running.pop(slot)
+                job.consumed += t - start
+                job.preempt_count += 1
+                waiting = sorted(waiting + [job], key=lambda j: (-j.priority, j.id))
+
+        for slot in range(slots):
+            if slot not in running and waiting:
+                job = waiting.pop(0)
+                running[slot] = (job, t)
+                if job.first_start is None:
+                    job.first_start = t
+
+        if all(j.finished is not None for j in jobs):
+            break
+    return jobs
+
+def _workload() -> List[SimJob]:
+    """۴ اسلات، ۲۴ تسک عادی طولانی و یک تسک فوری هر ۲۵۰ ثانیه."""
+    jobs = [SimJob(id=i, priority=scheduler.PRIORITY_NORMAL, duration=600, arrival=0) for i in range(24)]
+    for k in range(10):
+        jobs.append(SimJob(id=100 + k, priority=scheduler.PRIORITY_HIGH, duration=60, arrival=100 + 250 * k))
+    return jobs
+
+def _waits(jobs: List[SimJob], priority: int) -> List[int]:
+    return sorted(j.first_start - j.arrival for j in jobs if j.priority == priority)
+
+def test_preemption_cuts_high_priority_latency():
+    without = simulate(_workload(), slots=4, preemption=False)
+    with_preemption = simulate(_workload(), slots=4, preemption=True)
+
+    baseline = _waits(without, scheduler.PRIORITY_HIGH)
+    improved = _waits(with_preemption, scheduler.PRIORITY_HIGH)
+    p95 = lambda values: values[int(0.95 * (len(values) - 1))]
+
+    # بدون Preemption تسک فوری باید منتظر پایان یک تسک ۶۰۰ ثانیه‌ای بماند.
+    assert sum(baseline) / len(baseline) > 100
+    # با Preemption، انتظار حداکثر یک دوره بررسی است.
+    assert p95(improved) <= 5
+    assert max(improved) <= 5
+
+    # تمام کارها انجام شده و هیچ ثانیه‌ای از کار تسک‌های عادی دوباره حساب نشده است.
+    for job in with_preemption:
+        assert job.finished is not None and job.consumed == job.duration
+
+def test_policy_limits_evictions():
+    policy = PreemptionPolicy(max_preemptions=1, min_runtime_seconds=30)
+    jobs = simulate(_workload(), slots=4, preemption=True, policy=policy)
+    assert max(j.preempt_count for j in jobs) <= 1
+
+    running = [RunningJob(job_id=1, priority=0, started_at=100.0),
+               RunningJob(job_id=2, priority=0, started_at=80.0, preempt_count=1),
+               RunningJob(job_id=3, priority=10, started_at=0.0)]
+    # تسک ۱ هنوز ۳۰ ثانیه اجرا نشده، تسک ۲ سقف توقف را پر کرده و تسک ۳ هم‌اولویت است.
+    assert pick_victim(running, incoming_priority=10, now=110.0, policy=policy) is None
+    assert pick_victim(running, incoming_priority=10, now=130.0, policy=policy).job_id == 1
+
+# ==========================================
+#          تست‌های دیتابیس (Database)
+# ==========================================
+
+def _job(db, priority=0, status="APPROVED", duration=100, owner_id=1) -> models.Job:
+    job = models.Job(gpu_type="T4", gpu_count=1, command="run", estimated_duration=duration,
+                     status=status, priority=priority, owner_id=owner_id)
+    db.add(job)
+    db.commit()
+    return job
+
+def test_claim_prefers_priority_and_resumes_preempted(db_session, claim_path):
+    normal = _job(db_session)
+    urgent = _job(db_session, priority=scheduler.PRIORITY_HIGH)
+
+    assert leases.claim_next_job(db_session, "w1").id == urgent.id
+    assert leases.claim_next_job(db_session, "w1").id == normal.id
+
+    assert leases.peek_waiting_priority(db_session) is None
+    assert leases.preempt_job(db_session, normal.id, "w1", elapsed_seconds=40)
+    db_session.refresh(normal)
+    assert normal.status == "PREEMPTED"
+    assert normal.preempt_count == 1 and normal.consumed_seconds == 40
+    assert leases.peek_waiting_priority(db_session) == scheduler.PRIORITY_NORMAL
+
+    resumed = leases.claim_next_job(db_session, "w2")
+    assert resumed.id == normal.id and resumed.eta_seconds == 60
+    assert leases.finish_job(db_session, normal.id, "w2", "COMPLETED", elapsed_seconds=60)
+    db_session.refresh(normal)
+    assert normal.consumed_seconds == 100
+
+def test_preemption_without_checkpoint_keeps_full_budget(db_session, claim_path):
+    job = models.Job(gpu_type="T4", gpu_count=1, command="run", estimated_duration=100,
+                     status="APPROVED", owner_id=1)
+    db_session.add(job)
+    db_session.commit()
+    assert leases.claim_next_job(db_session, "w1").id == job.id
+    assert leases.preempt_job(db_session, job.id, "w1", elapsed_seconds=40, checkpointed=False)
+    db_session.refresh(job)
+    assert (job.status, job.consumed_seconds, job.preempt_count) == ("PREEMPTED", 0, 1)
+    assert leases.claim_next_job(db_session, "w2").eta_seconds == 100
+
+def test_waiting_job_is_reserved_only_once(db_session, claim_path):
+    normal = _job(db_session)
+    urgent = _job(db_session, priority=scheduler.PRIORITY_HIGH)
+    waiting = leases.peek_waiting_priority(db_session)
+    # دو Worker پر همزمان تسک منتظر را می‌بینند؛ فقط اولی آن را برمی‌دارد و تسکی متوقف می‌کند.
+    assert leases.claim_next_job(db_session, "w1", min_priority=waiting).id == urgent.id
+    assert leases.claim_next_job(db_session, "w2", min_priority=waiting) is None
+    # تسک کم‌اولویت‌تر صف برای Preemption رزرو نمی‌شود، ولی در صف عادی می‌ماند.
+    assert leases.claim_next_job(db_session, "w2").id == normal.id
+    for job_id, worker_id in ((urgent.id, "w1"), (normal.id, "w2")):
+        assert leases.finish_job(db_session, job_id, worker_id, "COMPLETED")
+
+def test_delete_preempted_job_refunds_unused_quota(db_session):
+    import main
+
+    owner = models.User(username="preempt_owner", hashed_password="x", quota=50)
+    db_session.add(owner)
+    db_session.commit()
+    job = _job(db_session, status="PREEMPTED", duration=100, owner_id=owner.id)
+    job.consumed_seconds = 30
+    db_session.commit()
+
+    main.delete_job(job.id, db=db_session, current_user=owner)
+    db_session.refresh(owner)
+    assert owner.quota == 50 + 70
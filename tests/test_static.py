@@ -0,0 +1,52 @@
+"""
+تست‌های فایل‌های استاتیک و کش صفحات (Static Assets Tests)
+--------------------------------------------------------
+1. نام نسخه‌دار فایل‌ها در صفحات و کش یک‌ساله (immutable).
+2. پاسخ 304 با هدر If-None-Match.
+3. ارسال نسخه فشرده gzip در صورت پشتیبانی کلاینت.
+"""
+
+import gzip
+import re
+from fastapi.testclient import TestClient
+
+def _hashed_styles_url(client: TestClient) -> str:
+    html = client.get("/").text
+    match = re.search(r'href="(/static/styles\.[0-9a-f]{8}\.css)"', html)
+    assert match, "آدرس نسخه‌دار styles.css در صفحه پیدا نشد"
+    return match.group(1)
+
+def test_hashed_asset_is_immutable(client: TestClient):
+    """فایل نسخه‌دار باید با Cache-Control طولانی و immutable سرو شود."""
+    response = client.get(_hashed_styles_url(client))
+    assert response.status_code == 200
+    assert "immutable" in response.headers["cache-control"]
+    assert response.headers["content-type"].startswith("text/css")
+
+def test_etag_not_modified(client: TestClient):
+    """درخواست دوباره با ETag قبلی باید 304 بدون بدنه برگرداند."""
+    first = client.get("/static/styles.css")
+    assert first.headers["cache-control"] == "no-cache"
+    etag = first.headers["etag"]
+
+    second = client.get("/static/styles.css", headers={"If-None-Match": etag})
+    assert second.status_code == 304
+    assert second.content == b""
+
+    page = client.get("/dashboard")
+    assert client.get("/dashboard", headers={"If-None-Match": page.headers["etag"]}).status_code == 304
+
+def test_gzip_variant(client: TestClient):
+    """کلاینتی که gzip را می‌پذیرد باید نسخه از پیش فشرده شده را دریافت کند."""
+    raw = client.get("/static/particles.js", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in raw.headers
+
+    # httpx بدنه را به صورت خودکار از حالت فشرده خارج می‌کند؛ برای بررسی بایت‌ها از stream استفاده می‌کنیم.
+    with client.stream("GET", "/static/particles.js", headers={"Accept-Encoding": "gzip"}) as response:
+        assert response.headers["content-encoding"] == "gzip"
+        compressed = b"".join(response.iter_raw())
+    assert len(compressed) < len(raw.content)
+    assert gzip.decompress(compressed) == raw.content
+
+def test_missing_static_file(client: TestClient):
+    assert client.get("/static/nope.css").status_code == 404
@@ -0,0 +1,211 @@
+"""
+تست‌های Worker (Worker Loop Tests)
+---------------------------------
+حلقه‌های واقعی worker.py (اسلات، Heartbeat و Preemption) با یک Backend آزمایشی
+روی دیتابیس تست اجرا می‌شوند:
+1. لغو اجرای تسکی که اجاره‌اش از دست رفته است (حذف تسک یا بازگشت به صف توسط Reaper).
+   خطای Backend یا ثبت نتیجه، تسک را RUNNING باقی نمی‌گذارد و Checkpoint تسک پایان یافته پاک می‌شود.
+2. Preemption واقعی: توقف تسک عادی برای تسک فوری و شارژ زمان فقط در صورت ذخیره Checkpoint.
+   برای هر تسک منتظر حداکثر یک تسک متوقف می‌شود (حتی با چند حلقه Preemption همزمان).
+"""
+
+import asyncio
+import os
+import time
+import pytest
+from sqlalchemy.pool import StaticPool
+import worker
+from app import database, executors, job_logs, leases, models, scheduler
+from app.executors import ExecutionBackend
+
+class BlockingBackend(ExecutionBackend):
+    """Backendی که تا لغو شدن اجرا می‌شود و شروع و لغو تسک‌ها را ثبت می‌کند."""
+    name = "blocking"
+
+    def __init__(self):
+        self.started, self.cancelled = [], []
+
+    async def run(self, job, log, progress=None) -> int:
+        self.started.append(job.id)
+        try:
+            await asyncio.sleep(3600)
+        except asyncio.CancelledError:
+            self.cancelled.append(job.id)
+            raise
+        return 0
+
+class FailingBackend(ExecutionBackend):
+    """Backendی که مثل پر بودن دیسک خطا می‌دهد."""
+    name = "failing"
+
+    async def run(self, job, log, progress=None) -> int:
+        raise OSError(28, "No space left on device")
+
+class CheckpointingBackend(BlockingBackend):
+    """Backendی که هنگام توقف وضعیت خود را ذخیره می‌کند."""
+
+    def checkpoint_time(self, job, since: float):
+        return time.time()
+
+class EarlyCheckpointBackend(BlockingBackend):
+    """Backendی که فقط یک ثانیه پس از شروع Checkpoint ذخیره کرده است."""
+
+    def checkpoint_time(self, job, since: float):
+        return since + 1
+
+@pytest.fixture
+def worker_env(engine, session_factory, db_session, tmp_path, monkeypatch):
+    if isinstance(engine.pool, StaticPool):
+        pytest.skip("Worker از چند ترد به دیتابیس دسترسی دارد؛ اتصال مشترک درون‌حافظه‌ای مناسب نیست")
+    monkeypatch.setattr(database, "SessionLocal", session_factory)
+    monkeypatch.setattr(job_logs, "LOG_DIR", str(tmp_path))
+    monkeypatch.setattr(executors, "CHECKPOINT_DIR", str(tmp_path / "checkpoints"))
+    monkeypatch.setattr(worker, "POLL_INTERVAL", 0.05)
+    monkeypatch.setattr(leases, "HEARTBEAT_INTERVAL", 0.1)
+    worker.running_slots.clear()
+    worker.reserved_jobs.clear()
+    # خاموش شدن Worker در پایان هر تست اجاره‌ها را باقی می‌گذارد (در عمل Reaper آن‌ها را آزاد می‌کند).
+    db_session.query(models.JobLease).delete()
+    db_session.query(models.Job).delete()
+    db_session.commit()
+    yield db_session
+    worker.running_slots.clear()
+    worker.reserved_jobs.clear()
+
+def _job(db, status="APPROVED", priority=0, duration=100) -> models.Job:
+    job = models.Job(gpu_type="T4", gpu_count=1, command="run", estimated_duration=duration,
+                     status=status, priority=priority, owner_id=1)
+    db.add(job)
+    db.commit()
+    return job
+
+async def _until(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "شرط در زمان مقرر برقرار نشد"
+        await asyncio.sleep(0.02)
+
+async def _run_loops(loops, scenario) -> None:
+    tasks = [asyncio.create_task(loop) for loop in loops]
+    try:
+        await scenario()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def _delete_job(db, job_id: int) -> None:
+    leases.release_job_lease(db, job_id)
+    db.query(models.Job).filter(models.Job.id == job_id).delete(synchronize_session=False)
+    db.commit()
+
+def test_worker_cancels_job_whose_lease_is_gone(worker_env):
+    job = _job(worker_env)
+    backend = BlockingBackend()
+
+    async def scenario():
+        await _until(lambda: job.id in backend.started)
+        # کاربر تسک در حال اجرا را حذف می‌کند؛ Heartbeat بعدی اجرای آن را متوقف می‌کند.
+        await asyncio.to_thread(worker._run_db, _delete_job, job.id)
+        await _until(lambda: job.id in backend.cancelled)
+        await _until(lambda: not worker.running_slots)
+
+    asyncio.run(_run_loops([worker.slot_loop(0, backend), worker.heartbeat_loop()], scenario))
+    assert backend.started == [job.id]
+
+def _status(db, job_id: int) -> str:
+    return db.query(models.Job.status).filter(models.Job.id == job_id).scalar()
+
+def test_backend_error_marks_job_failed(worker_env):
+    job = _job(worker_env)
+
+    async def scenario():
+        await _until(lambda: worker._run_db(_status, job.id) == "FAILED")
+
+    asyncio.run(_run_loops([worker.slot_loop(0, FailingBackend()), worker.heartbeat_loop()], scenario))
+    assert worker_env.query(models.JobLease).filter(models.JobLease.job_id == job.id).first() is None
+
+def test_finished_job_checkpoint_is_removed(worker_env):
+    job = _job(worker_env)
+    path = executors.checkpoint_path(job.storage_key)
+    os.makedirs(path)
+    with open(os.path.join(path, "state.pt"), "w") as handle:
+        handle.write("weights")
+
+    async def scenario():
+        await _until(lambda: worker._run_db(_status, job.id) == "FAILED")
+        await _until(lambda: not os.path.exists(path))
+
+    asyncio.run(_run_loops([worker.slot_loop(0, FailingBackend()), worker.heartbeat_loop()], scenario))
+
+def test_reaper_recovers_job_whose_result_could_not_be_saved(worker_env, monkeypatch):
+    monkeypatch.setattr(leases, "LEASE_TTL", 0.3)
+    monkeypatch.setattr(leases, "REAP_INTERVAL", 0.2)
+    job = _job(worker_env)
+    backend = FailingBackend()
+
+    def locked_database(*args):
+        raise RuntimeError("database is locked")
+    monkeypatch.setattr(leases, "finish_job", locked_database)
+
+    async def scenario():
+        # Worker زنده است و Heartbeat می‌فرستد، ولی اجاره تسکی را که اجرا نمی‌کند تمدید نمی‌کند.
+        def recovered(db):
+            attempts, status = db.query(models.Job.attempts, models.Job.status).filter(
+                models.Job.id == job.id).one()
+            return attempts >= 1 and status != "RUNNING"
+        await _until(lambda: worker._run_db(recovered), timeout=3.0)
+
+    asyncio.run(_run_loops([worker.slot_loop(0, backend), worker.heartbeat_loop(), worker.reaper_loop()],
+                           scenario))
+
+@pytest.mark.parametrize("backend_class, min_runtime, charged", [
+    (BlockingBackend, 1.0, lambda seconds: seconds == 0),
+    (CheckpointingBackend, 1.0, lambda seconds: seconds >= 1),
+    # کار انجام شده پس از آخرین Checkpoint از دست رفته و شارژ نمی‌شود.
+    (EarlyCheckpointBackend, 2.0, lambda seconds: seconds == 1),
+])
+def test_preemption_loop_stops_normal_job_for_urgent_one(worker_env, monkeypatch, backend_class, min_runtime,
+                                                         charged):
+    monkeypatch.setattr(worker, "PREEMPT_CHECK_INTERVAL", 0.05)
+    monkeypatch.setattr(worker, "PREEMPTION_POLICY", scheduler.PreemptionPolicy(min_runtime_seconds=min_runtime))
+    normal = _job(worker_env)
+    backend = backend_class()
+    state = {}
+
+    async def scenario():
+        await _until(lambda: normal.id in backend.started)
+        state["urgent"] = await asyncio.to_thread(worker._run_db, lambda db: _job(db, priority=10).id)
+        await _until(lambda: state["urgent"] in backend.started)
+
+    asyncio.run(_run_loops([worker.slot_loop(0, backend), worker.preemption_loop(1)], scenario))
+    assert backend.cancelled[0] == normal.id
+    assert backend.started[:2] == [normal.id, state["urgent"]]
+
+    worker_env.expire_all()
+    stopped = worker_env.query(models.Job).filter(models.Job.id == normal.id).one()
+    assert (stopped.status, stopped.preempt_count) == ("PREEMPTED", 1)
+    # بدون Checkpoint کار انجام شده از دست رفته و بودجه اجرای بعدی کامل می‌ماند.
+    assert charged(stopped.consumed_seconds)
+    assert worker_env.query(models.JobLease).filter(models.JobLease.job_id == normal.id).first() is None
+
+def test_waiting_job_causes_at_most_one_preemption(worker_env, monkeypatch):
+    monkeypatch.setattr(worker, "PREEMPT_CHECK_INTERVAL", 0.05)
+    monkeypatch.setattr(worker, "PREEMPTION_POLICY", scheduler.PreemptionPolicy(min_runtime_seconds=0.0))
+    normal = [_job(worker_env).id, _job(worker_env).id]
+    backend = BlockingBackend()
+    state = {}
+
+    async def scenario():
+        await _until(lambda: set(normal) <= set(backend.started))
+        state["urgent"] = await asyncio.to_thread(worker._run_db, lambda db: _job(db, priority=10).id)
+        await _until(lambda: state["urgent"] in backend.started)
+        await asyncio.sleep(0.3)
+        state["cancelled"] = list(backend.cancelled)  # پیش از لغو همه تسک‌ها با پایان تست
+
+    # دو حلقه Preemption همزمان (مثل چند Worker پر) تسک منتظر را می‌بینند، ولی فقط یکی آن را رزرو می‌کند.
+    loops = [worker.slot_loop(0, backend), worker.slot_loop(1, backend),
+             worker.preemption_loop(2), worker.preemption_loop(2)]
+    asyncio.run(_run_loops(loops, scenario))
+    assert len(state["cancelled"]) == 1 and state["cancelled"][0] in normal
+    assert backend.started.count(state["urgent"]) == 1
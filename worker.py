@@ -1,71 +1,286 @@
 """
 سرویس پردازشگر پس‌زمینه (Background Worker)
 ------------------------------------------
-این اسکریپت به صورت مستقل اجرا می‌شود و وظیفه شبیه‌سازی اجرای تسک‌ها روی GPU را دارد.
+این اسکریپت به صورت مستقل اجرا می‌شود و وظیفه اجرای تسک‌ها روی GPU را دارد.
 جدا کردن Worker از Main API باعث می‌شود سرور اصلی هنگام پردازش‌های سنگین قفل نشود (Non-blocking).
+
+ساختار داخلی (asyncio):
+- چند اسلات (Slot) که هر کدام به صورت مستقل یک تسک را برمی‌دارند و اجرا می‌کنند.
+- یک حلقه Heartbeat، یک حلقه Reaper و یک حلقه نوشتن دسته‌ای گزارش‌های پیشرفت.
+- یک حلقه Preemption: وقتی همه اسلات‌ها پر هستند و تسکی با اولویت بالاتر منتظر است،
+  آن تسک ابتدا برای این Worker برداشته (رزرو) می‌شود و سپس یکی از تسک‌های کم‌اولویت‌تر
+  این Worker متوقف (PREEMPTED) و به صف برگردانده می‌شود؛ پس برای هر تسک منتظر حداکثر یک تسک متوقف می‌شود.
+تمام دسترسی‌های دیتابیس در Thread Pool انجام می‌شوند تا حلقه رویداد هرگز مسدود نشود.
+لاگ‌ها به صورت JSON از طریق صف (app/logging_setup.py) نوشته می‌شوند و شناسه تسک و
+شناسه درخواست ثبت کننده (request_id) را دارند؛ job.started شناسه درخواست تایید کننده را هم ثبت می‌کند.
 """
 
-import time
+import asyncio
+import functools
+import logging
 import sys
 import os
-from datetime import datetime
+import socket
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Optional, Tuple
 from sqlalchemy.orm import Session
 
 # اضافه کردن مسیر جاری به sys.path برای شناسایی پکیج 'app'
 sys.path.append(os.getcwd())
-from app import models, database
+from app import models, database, leases, scheduler, logging_setup
+from app.executors import ExecutionBackend, JobSpec, get_backend, remove_checkpoint
+from app.job_logs import JobLog
+from app.logging_setup import log_event
+from app.progress import FLUSH_INTERVAL, ProgressTracker
+
+# شناسه یکتای این پروسه Worker
+WORKER_ID = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+# سیاست Preemption این Worker
+PREEMPTION_POLICY = scheduler.DEFAULT_POLICY
+# تعداد تسک‌های همزمان این Worker
+WORKER_SLOTS = int(os.environ.get("GPU_WORKER_SLOTS", 1))
+# فاصله بررسی صف وقتی تسکی وجود ندارد (ثانیه)
+POLL_INTERVAL = 2
+# فاصله بررسی نیاز به Preemption (ثانیه)
+PREEMPT_CHECK_INTERVAL = 5
+# بافر گزارش‌های پیشرفت تمام اسلات‌ها (به صورت دسته‌ای در دیتابیس نوشته می‌شود)
+progress_tracker = ProgressTracker()
+logger = logging_setup.get_logger("worker")
+
+@dataclass
+class SlotState:
+    """تسک در حال اجرای یک اسلات."""
+    job: JobSpec
+    task: asyncio.Task
+    started_at: float
+    # دلیل لغو اجرا توسط خود Worker: None، "preempted" یا "lease_lost"
+    cancel_reason: Optional[str] = None
+
+# اسلات -> تسک در حال اجرا (فقط در حلقه رویداد خوانده و نوشته می‌شود)
+running_slots: Dict[int, SlotState] = {}
+# تسک‌های رزرو شده توسط حلقه Preemption (با زمان رزرو) که اولین اسلات آزاد اجرا می‌کند
+reserved_jobs: Deque[Tuple[JobSpec, float]] = deque()
+
+def _run_db(fn, *args):
+    """اجرای تابع fn(db, *args) با نشست دیتابیس اختصاصی (داخل Thread)."""
+    db: Session = database.SessionLocal()
+    try:
+        return fn(db, *args)
+    finally:
+        db.close()
+
+def _claim(worker_id: str, min_priority: Optional[int] = None) -> Optional[JobSpec]:
+    db: Session = database.SessionLocal()
+    try:
+        job = leases.claim_next_job(db, worker_id, min_priority=min_priority)
+        return JobSpec.from_job(job) if job else None
+    finally:
+        db.close()
 
-def process_jobs() -> None:
+async def slot_loop(slot: int, backend: ExecutionBackend) -> None:
     """
-    حلقه اصلی پردازش (Main Processing Loop).
-    
-    چرخه حیات یک تسک در اینجا:
-    1. Polling: بررسی دیتابیس برای تسک‌های جدید (وضعیت APPROVED).
-    2. Start: تغییر وضعیت به RUNNING و ثبت زمان شروع.
-    3. Execution: شبیه‌سازی پردازش (استفاده از sleep به جای درگیر کردن واقعی GPU).
-    4. Finish: تغییر وضعیت به COMPLETED و ثبت زمان پایان.
+    حلقه یک اسلات پردازش.
+    1. Claim: اجرای تسک رزرو شده توسط حلقه Preemption، یا برداشتن اتمیک تسک بعدی صف
+       (به ترتیب اولویت) و گرفتن اجاره (Lease).
+    2. Execution: اجرای دستور توسط Backend و ذخیره خروجی در لاگ چرخشی.
+    3. Finish: تغییر وضعیت به COMPLETED/FAILED و آزاد کردن اجاره؛
+       یا در صورت Preemption، ثبت زمان مصرف شده و برگرداندن تسک به صف (PREEMPTED).
     """
-    print("👷 Worker started! Waiting for APPROVED jobs... (Press Ctrl+C to stop)")
-    
     while True:
-        # ایجاد یک نشست دیتابیس جدید در هر دور حلقه
-        db: Session = database.SessionLocal()
         try:
-            # جستجو برای قدیمی‌ترین تسک که توسط ادمین تایید شده است (FIFO)
-            job = db.query(models.Job).filter(models.Job.status == "APPROVED").first()
-
-            if job:
-                print(f"⚡ Processing Job #{job.id}: {job.command}")
-                
-                # --- مرحله ۱: شروع پردازش ---
-                job.status = "RUNNING"
-                job.started_at = datetime.now()
-                db.commit()
-                
-                # --- مرحله ۲: شبیه‌سازی اجرا ---
-                # در محیط واقعی، اینجا کد PyTorch یا TensorFlow اجرا می‌شود.
-                # ما فعلاً با time.sleep زمان پردازش را شبیه‌سازی می‌کنیم.
-                duration = job.estimated_duration or 10
-                for i in range(duration):
-                    # شبیه‌سازی پیشرفت کار (هر ثانیه)
-                    time.sleep(1)
-                    # (اختیاری: می‌توان درصد پیشرفت را در دیتابیس آپدیت کرد)
-
-                # --- مرحله ۳: پایان پردازش ---
-                job.status = "COMPLETED"
-                job.completed_at = datetime.now()
-                db.commit()
-                print(f"✅ Job #{job.id} Completed successfully.\n")
-            
+            if reserved_jobs:
+                job, _ = reserved_jobs.popleft()
             else:
-                # اگر هیچ تسکی نبود، ۲ ثانیه صبر می‌کنیم تا فشار روی دیتابیس و CPU کم شود.
-                time.sleep(2)
-                
-        except Exception as e:
-            print(f"❌ Worker Error: {e}")
-            # در صورت بروز خطا، بهتر است نشست دیتابیس بسته شود تا کانکشن باز نماند.
-        finally:
-            db.close()
+                job = await asyncio.to_thread(_claim, WORKER_ID)
+            if job is None:
+                # اگر هیچ تسکی نبود، کمی صبر می‌کنیم تا فشار روی دیتابیس و CPU کم شود.
+                await asyncio.sleep(POLL_INTERVAL)
+                continue
+
+            # تمام لاگ‌های این تسک (از جمله لاگ‌های Backend) شناسه درخواست ثبت کننده را دارند.
+            with logging_setup.bind(job_id=job.id, request_id=job.request_id):
+                await _execute(slot, job, backend)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # اگر ثبت نتیجه هم شکست بخورد، اجاره تسک دیگر تمدید نمی‌شود (در running_slots نیست)
+            # و پس از انقضا توسط Reaper بازیابی می‌شود.
+            log_event(logger, "worker.error", logging.ERROR, exc_info=True, slot=slot)
+            await asyncio.sleep(POLL_INTERVAL)
+
+async def _execute(slot: int, job: JobSpec, backend: ExecutionBackend) -> None:
+    """اجرای یک تسک برداشته شده و ثبت نتیجه (پایان یا Preemption)."""
+    log_event(logger, "job.started", slot=slot, command=job.command,
+              resumed_from=job.consumed_seconds, backend=backend.name,
+              approved_request_id=job.approved_request_id)
+    wall_started, started_at = time.time(), time.monotonic()
+    state: Optional[SlotState] = None
+    log: Optional[JobLog] = None
+    cancel_reason = None
+    try:
+        log = await JobLog(job.storage_key).open()
+        run = asyncio.create_task(
+            backend.run(job, log, functools.partial(progress_tracker.report, job.id))
+        )
+        state = running_slots[slot] = SlotState(job=job, task=run, started_at=started_at)
+        exit_code = await run
+    except asyncio.CancelledError:
+        # اگر لغو از طرف خود Worker نباشد (مثلاً خاموش شدن Worker)، به بالا منتقل می‌شود.
+        if state is None or state.cancel_reason is None or not run.cancelled():
+            raise
+        cancel_reason, exit_code = state.cancel_reason, None
+    except Exception:
+        # خطای Backend یا لاگ (مثلاً پر بودن دیسک): تسک FAILED ثبت می‌شود تا RUNNING باقی نماند.
+        log_event(logger, "job.crashed", logging.ERROR, exc_info=True)
+        exit_code = None
+    finally:
+        running_slots.pop(slot, None)
+        if log is not None:
+            await log.aclose()
+        progress_tracker.discard(job.id)
+
+    elapsed = int(time.monotonic() - started_at)
+    if cancel_reason == "lease_lost":
+        # تسک به صف برگشته یا حذف شده است؛ هیچ وضعیتی ثبت نمی‌شود.
+        log_event(logger, "job.lease_lost", logging.WARNING, elapsed_seconds=elapsed, cancelled=True)
+        return
+    if cancel_reason == "preempted":
+        # فقط زمان اجرا تا آخرین Checkpoint از بودجه کم می‌شود؛ کار بعد از آن دوباره انجام خواهد شد.
+        saved_at = await asyncio.to_thread(backend.checkpoint_time, job, wall_started)
+        checkpointed = saved_at is not None
+        charged = min(elapsed, max(0, int(saved_at - wall_started))) if checkpointed else 0
+        if await asyncio.to_thread(_run_db, leases.preempt_job, job.id, WORKER_ID, charged, checkpointed):
+            log_event(logger, "job.preempted", elapsed_seconds=elapsed, charged_seconds=charged,
+                      checkpointed=checkpointed)
+        return
+
+    status = "COMPLETED" if exit_code == 0 else "FAILED"
+    if await asyncio.to_thread(_run_db, leases.finish_job, job.id, WORKER_ID, status, elapsed):
+        # تسک دیگر ادامه داده نمی‌شود؛ Checkpoint آن پاک می‌شود.
+        await asyncio.to_thread(remove_checkpoint, job.storage_key)
+        log_event(logger, "job.finished", status=status, exit_code=exit_code, elapsed_seconds=elapsed)
+    else:
+        log_event(logger, "job.lease_lost", logging.WARNING, exit_code=exit_code)
+
+async def heartbeat_loop() -> None:
+    """ارسال ضربان قلب و تمدید تمام اجاره‌های این Worker با یک دستور."""
+    while True:
+        await asyncio.sleep(leases.HEARTBEAT_INTERVAL)
+        try:
+            sent_at = time.monotonic()
+            running = {state.job.id for state in running_slots.values()}
+            running.update(job.id for job, _ in reserved_jobs)
+            renewed = await asyncio.to_thread(_run_db, leases.heartbeat, WORKER_ID, running)
+            log_event(logger, "worker.heartbeat", logging.DEBUG, category="heartbeat", leases_renewed=len(renewed))
+            cancel_lost_leases(renewed, sent_at)
+        except Exception:
+            log_event(logger, "worker.heartbeat_failed", logging.ERROR, exc_info=True)
+
+def cancel_lost_leases(renewed, sent_at: float) -> None:
+    """
+    لغو اجرای تسک‌هایی که اجاره‌شان دیگر متعلق به این Worker نیست
+    (Reaper آن‌ها را به صف برگردانده یا کاربر حذفشان کرده) تا تسک دو بار اجرا نشود
+    یا GPU تا پایان زمان مجاز اشغال نماند.
+    فقط اسلات‌هایی بررسی می‌شوند که قبل از ارسال Heartbeat شروع شده‌اند، چون اجاره
+    تسک تازه برداشته شده ممکن است در نتیجه Heartbeat دیده نشده باشد.
+    """
+    for state in list(running_slots.values()):
+        if state.cancel_reason is None and state.started_at < sent_at and state.job.id not in renewed:
+            state.cancel_reason = "lease_lost"
+            state.task.cancel()
+    # تسک رزرو شده‌ای که اجاره‌اش را از دست داده اصلاً اجرا نمی‌شود.
+    for entry in list(reserved_jobs):
+        job, reserved_at = entry
+        if reserved_at < sent_at and job.id not in renewed:
+            reserved_jobs.remove(entry)
+            log_event(logger, "job.lease_lost", logging.WARNING, job_id=job.id, reserved=True)
+
+async def progress_flush_loop() -> None:
+    """نوشتن گزارش‌های پیشرفت ادغام شده با یک UPDATE دسته‌ای در هر دوره."""
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL)
+        try:
+            rows = await asyncio.to_thread(_run_db, progress_tracker.flush)
+            if rows:
+                log_event(logger, "progress.flushed", category="progress", rows=rows)
+        except Exception:
+            log_event(logger, "progress.flush_failed", logging.ERROR, exc_info=True)
+
+async def preemption_loop(slots: int) -> None:
+    """
+    بررسی دوره‌ای نیاز به پیش‌دستی (Preemption).
+    فقط وقتی همه اسلات‌ها پر هستند یک کوئری سبک (بیشترین اولویت منتظر) اجرا می‌شود
+    و در هر دور حداکثر یک تسک متوقف می‌شود.
+    پیش از توقف، تسک منتظر با UPDATE شرطی برای این Worker برداشته می‌شود تا Workerهای دیگر
+    برای همان تسک تسکی متوقف نکنند؛ اگر زودتر برداشته شده باشد، چیزی متوقف نمی‌شود.
+    """
+    while True:
+        await asyncio.sleep(PREEMPT_CHECK_INTERVAL)
+        if len(running_slots) < slots:
+            continue
+        try:
+            waiting = await asyncio.to_thread(_run_db, leases.peek_waiting_priority)
+            if waiting is None:
+                continue
+            candidates = {
+                state.job.id: state for state in running_slots.values() if state.cancel_reason is None
+            }
+            victim = scheduler.pick_victim(
+                [scheduler.RunningJob(job_id=st.job.id, priority=st.job.priority,
+                                      started_at=st.started_at, preempt_count=st.job.preempt_count)
+                 for st in candidates.values()],
+                incoming_priority=waiting,
+                now=time.monotonic(),
+                policy=PREEMPTION_POLICY,
+            )
+            if victim is None:
+                continue
+            reserved = await asyncio.to_thread(_claim, WORKER_ID, waiting)
+            if reserved is None:
+                continue  # Worker دیگری تسک منتظر را برداشته است
+            reserved_jobs.append((reserved, time.monotonic()))
+            state = candidates[victim.job_id]
+            if state.cancel_reason is None and not state.task.done():
+                state.cancel_reason = "preempted"
+                state.task.cancel()
+                log_event(logger, "job.preempting", job_id=victim.job_id, request_id=state.job.request_id,
+                          victim_priority=victim.priority, waiting_priority=waiting, reserved_job_id=reserved.id)
+        except Exception:
+            log_event(logger, "worker.preemption_failed", logging.ERROR, exc_info=True)
+
+async def reaper_loop() -> None:
+    """بازیابی تسک‌هایی که اجاره‌شان منقضی شده (Worker از کار افتاده)."""
+    while True:
+        try:
+            for job_id, new_status in await asyncio.to_thread(_run_db, leases.reap_expired_leases):
+                log_event(logger, "lease.expired", logging.WARNING, job_id=job_id, status=new_status)
+        except Exception:
+            log_event(logger, "worker.reaper_failed", logging.ERROR, exc_info=True)
+        await asyncio.sleep(leases.REAP_INTERVAL)
+
+async def process_jobs(slots: int = WORKER_SLOTS, backend: Optional[ExecutionBackend] = None) -> None:
+    """نقطه شروع Worker: ثبت در جدول workers و راه‌اندازی اسلات‌ها و حلقه‌های پس‌زمینه."""
+    backend = backend or get_backend()
+    log_event(logger, "worker.started", worker_id=WORKER_ID, slots=slots, backend=backend.name)
+
+    models.Base.metadata.create_all(bind=database.engine)
+    database.upgrade_schema()
+    await asyncio.to_thread(_run_db, leases.register_worker, WORKER_ID, socket.gethostname(), os.getpid())
+
+    await asyncio.gather(
+        *(slot_loop(i, backend) for i in range(slots)),
+        heartbeat_loop(),
+        progress_flush_loop(),
+        preemption_loop(slots),
+        reaper_loop(),
+    )
 
 if __name__ == "__main__":
-    process_jobs()
\ No newline at end of file
+    logging_setup.setup_logging("worker")
+    try:
+        asyncio.run(process_jobs())
+    except KeyboardInterrupt:
+        pass